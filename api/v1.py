@@ -0,0 +1,280 @@
+#----------------------------------------------------------------------------#
+# JSON API, mounted at /api/v1.
+#
+# List endpoints stream newline-delimited JSON straight from a server-side
+# cursor, so memory use doesn't grow with the table; the venue and artist
+# lists take the ?genre=, ?city=, ?state= and ?seeking= filters of
+# queries/facets.py. Every endpoint sends an ETag and answers 304 Not
+# Modified to a matching If-None-Match.
+#----------------------------------------------------------------------------#
+import hashlib
+import json
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+from sqlalchemy import func
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from queries.venues import get_venue_detail
+from queries.artists import get_artist_detail
+from queries.scheduling import get_free_slots
+from queries.geo import find_upcoming_shows_near, find_venues_near, MAX_RADIUS_KM
+from queries.facets import FILTER_ARGS, filter_query, get_facets, parse_facet_filters
+from utils.cache import cache, request_ident
+from utils.connection import db
+from utils.dates import parse_naive_datetime
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+# rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = 500
+# longest window /venues/<id>/free-slots answers for
+MAX_FREE_SLOTS_DAYS = 92
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def venue_to_dict(venue):
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "city": venue.city,
+        "state": venue.state,
+        "address": venue.address,
+        "phone": venue.phone,
+        "genres": venue.genres,
+        "image_link": venue.image_link,
+        "facebook_link": venue.facebook_link,
+        "website": venue.website,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "latitude": venue.latitude,
+        "longitude": venue.longitude,
+        "updated_at": _isoformat(venue.updated_at)
+    }
+
+
+def artist_to_dict(artist):
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "genres": artist.genres,
+        "image_link": artist.image_link,
+        "facebook_link": artist.facebook_link,
+        "website": artist.website,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "updated_at": _isoformat(artist.updated_at)
+    }
+
+
+def show_to_dict(row):
+    return {
+        "id": row.id,
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": _isoformat(row.start_time),
+        "duration_minutes": row.duration_minutes,
+        "updated_at": _isoformat(row.updated_at)
+    }
+
+
+def _shows_query():
+    return db.session.query(
+        Show.id,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time,
+        Show.duration_minutes,
+        Show.updated_at
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id)
+
+
+def table_etag(*models):
+    # Weak ETag for a whole-table listing: row count, highest id and latest
+    # updated_at of each table. Inserts, deletes and ORM updates all change it.
+    values = []
+    for model in models:
+        values.extend(db.session.query(
+            func.count(model.id),
+            func.max(model.id),
+            func.max(model.updated_at)
+        ).one())
+    return hashlib.md5(repr(values).encode('utf-8')).hexdigest()
+
+
+def stream_ndjson(query, serialize, etag):
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield json.dumps(serialize(row)) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def json_response(data):
+    # detail loaders return datetimes; str() keeps the "YYYY-MM-DD HH:MM:SS" form
+    return json_body_response(json.dumps(data, default=str))
+
+
+def json_body_response(body):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(hashlib.md5(body.encode('utf-8')).hexdigest())
+    return response.make_conditional(request)
+
+
+def _filter_args():
+    try:
+        return parse_facet_filters(request.args)
+    except ValueError:
+        abort(400)
+
+
+def facets_response(model, namespace):
+    # facet counts are cached with the HTML listing of the same namespace,
+    # which is invalidated whenever a row changes
+    filters = _filter_args()
+    key = cache.key(namespace, request_ident('facets', FILTER_ARGS))
+    body = cache.get_key(namespace, key)
+    if body is None:
+        body = json.dumps(get_facets(model, **filters))
+        cache.set_key(key, body)
+    return json_body_response(body)
+
+
+@api.route('/venues')
+def list_venues():
+    query = filter_query(Venue.query, Venue, **_filter_args()).order_by(Venue.id)
+    return stream_ndjson(query, venue_to_dict, table_etag(Venue))
+
+
+@api.route('/venues/facets')
+def get_venue_facets():
+    # counts per genre, city, state and seeking flag of the matching venues
+    return facets_response(Venue, 'venues')
+
+
+def _location_args(radius_required=False):
+    # (latitude, longitude, radius_km, limit) from ?lat=&lng=&radius_km=&limit=
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius_km = request.args.get('radius_km', type=float)
+    limit = request.args.get('limit', type=int)
+    if latitude is None or longitude is None or not -90 <= latitude <= 90 \
+            or not -180 <= longitude <= 180:
+        abort(400)
+    if radius_km is None and radius_required:
+        abort(400)
+    if radius_km is not None and not 0 < radius_km <= MAX_RADIUS_KM:
+        abort(400)
+    return latitude, longitude, radius_km, limit
+
+
+@api.route('/venues/near')
+def list_venues_near():
+    # the venues within radius_km, or the limit nearest ones, nearest first
+    latitude, longitude, radius_km, limit = _location_args()
+    return json_response(find_venues_near(latitude, longitude, radius_km, limit))
+
+
+@api.route('/shows/near')
+def list_shows_near():
+    # the next upcoming shows at venues within radius_km, soonest first
+    latitude, longitude, radius_km, limit = _location_args(radius_required=True)
+    data = find_upcoming_shows_near(latitude, longitude, radius_km, limit)
+    for show in data:
+        show["start_time"] = _isoformat(show["start_time"])
+    return json_response(data)
+
+
+@api.route('/venues/<int:venue_id>')
+def get_venue(venue_id):
+    data = get_venue_detail(venue_id)
+    if data is None:
+        abort(404)
+    return json_response(data)
+
+
+@api.route('/venues/<int:venue_id>/free-slots')
+def get_venue_free_slots(venue_id):
+    # ?from=&to= (default: the next 7 days) and min_minutes (default 60)
+    try:
+        start = parse_naive_datetime(request.args['from']) if request.args.get('from') \
+            else datetime.now().replace(second=0, microsecond=0)
+        end = parse_naive_datetime(request.args['to']) if request.args.get('to') \
+            else start + timedelta(days=7)
+    except (ValueError, OverflowError):
+        abort(400)
+    min_minutes = request.args.get('min_minutes', 60, type=int)
+    if end <= start or end - start > timedelta(days=MAX_FREE_SLOTS_DAYS) or min_minutes < 1:
+        abort(400)
+    if db.session.query(Venue.id).filter_by(id=venue_id).scalar() is None:
+        abort(404)
+
+    slots = get_free_slots(venue_id, start, end, min_minutes)
+    return json_response({
+        "venue_id": venue_id,
+        "from": _isoformat(start),
+        "to": _isoformat(end),
+        "min_minutes": min_minutes,
+        "free_slots": [{"start": _isoformat(slot_start), "end": _isoformat(slot_end)}
+                       for slot_start, slot_end in slots]
+    })
+
+
+@api.route('/artists')
+def list_artists():
+    query = filter_query(Artist.query, Artist, **_filter_args()).order_by(Artist.id)
+    return stream_ndjson(query, artist_to_dict, table_etag(Artist))
+
+
+@api.route('/artists/facets')
+def get_artist_facets():
+    # counts per genre, city, state and seeking flag of the matching artists
+    return facets_response(Artist, 'artists')
+
+
+@api.route('/artists/<int:artist_id>')
+def get_artist(artist_id):
+    data = get_artist_detail(artist_id)
+    if data is None:
+        abort(404)
+    return json_response(data)
+
+
+@api.route('/shows')
+def list_shows():
+    query = _shows_query().order_by(Show.start_time, Show.id)
+    return stream_ndjson(query, show_to_dict, table_etag(Show, Venue, Artist))
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+    row = _shows_query().filter(Show.id == show_id).first()
+    if row is None:
+        abort(404)
+    return json_response(show_to_dict(row))
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({"error": error.name}), error.code
@@ -8,9 +8,7 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -18,11 +16,38 @@ import sys
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from models.Venue import Venue
 from models.Artist import Artist
-from models.Show import Show
-from utils.connection import db
+from models.Show import Show, DEFAULT_DURATION_MINUTES
+from queries.venues import get_venue_areas, get_venue_detail
+from queries.artists import get_artists, get_artist_detail
+from queries.shows import count_upcoming_venue_shows, count_upcoming_artist_shows, get_shows_page, parse_show_filters
+from queries.search import find_venues, find_artists
+from queries.scheduling import find_conflicts
+from queries.facets import FILTER_ARGS, get_artist_facets, get_venue_facets, parse_facet_filters
+from utils.connection import db, init_db, pool_metrics
+from utils.cache import cache
+from utils.profiling import init_profiling
+from utils.metrics import init_metrics
+from utils.jobs import enqueue, init_jobs
+from utils.fragments import init_fragments
+from utils.dates import format_datetime, set_preferences
+from utils.assets import init_assets
+from utils.types import GENRES
+# registers the ORM events that keep the per-entity show counters current
+import utils.counters
+# registers the background tasks
+import tasks
+from api.v1 import api
+from commands.importer import import_command
+from commands.exporter import export_command
+from commands.counters import rollover_shows_command
+from commands.worker import worker_command
+from commands.assets import build_assets_command
+from commands.geocode import geocode_command
+from commands.matches import compute_matches_command
 from forms import *
 #----------------------------------------------------------------------------#
 # App Config.
@@ -31,8 +56,22 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db.init_app(app)
+init_db(app)
+init_profiling(app)
+init_metrics(app)
+init_jobs(app)
+init_fragments(app)
+init_assets(app)
+cache.init_app(app)
 migrate = Migrate(app, db)
+app.register_blueprint(api)
+app.cli.add_command(import_command)
+app.cli.add_command(export_command)
+app.cli.add_command(rollover_shows_command)
+app.cli.add_command(worker_command)
+app.cli.add_command(build_assets_command)
+app.cli.add_command(geocode_command)
+app.cli.add_command(compute_matches_command)
 
 # TODO: connect to a local postgresql database
 
@@ -45,15 +84,6 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
@@ -61,62 +91,45 @@ app.jinja_env.filters['datetime'] = format_datetime
 #----------------------------------------------------------------------------#
 
 
+def enqueue_match_refresh():
+    # suggestions depend on genres, location and seeking flags; edits within
+    # MATCHES_REFRESH_DELAY of each other share one recomputation
+    enqueue('compute_matches', key='compute_matches',
+            delay=app.config.get('MATCHES_REFRESH_DELAY', 300))
+
+
 @app.route('/')
 def index():
     return render_template('pages/home.html')
 
 
-#  Venues
-#  ----------------------------------------------------------------
-def get_upcoming_shows(shows):
-    num_of_upcoming_shows = 0
-
-    for show in shows:
-        if show.start_time.isoformat() >= datetime.now().isoformat():
-            num_of_upcoming_shows += 1
-    return num_of_upcoming_shows
-
-def get_upcoming_venue_shows(venue):
-    # get the num of upcoming shows for that venue ID
-    all_shows = Show.query.filter_by(venue_id=venue.id).all()
-    return get_upcoming_shows(all_shows)
-    
-def get_upcoming_artist_shows(artist):
-    # get the num of upcoming shows for that artist ID
-    all_shows = Show.query.filter_by(venue_id=artist.id).all()
-    return get_upcoming_shows(all_shows)
-
+@app.route('/preferences', methods=['POST'])
+def preferences():
+    # locale and timezone dates are shown in, for this visitor
+    try:
+        set_preferences(request.form.get('locale'), request.form.get('timezone'))
+    except ValueError as e:
+        flash(str(e))
+    if request.referrer and request.referrer.startswith(request.host_url):
+        return redirect(request.referrer)
+    return redirect(url_for('index'))
 
-def addVenue(venue):
-    new_venue = dict()
-    new_venue["id"] = venue.id
-    new_venue["name"] = venue.name
-    new_venue["num_upcoming_shows"] = get_upcoming_venue_shows(venue)
-    return new_venue
 
+#  Venues
+#  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues', vary=FILTER_ARGS)
 def venues():
-    # TODO: replace with real venues data.
-    #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    all_venues = Venue.query.all()
-    venueDict = dict()
-    state = list()
-    data = list()
-    for venue in all_venues:
-        venueDict["city"] = venue.city
-        venueDict["state"] = venue.state
-        venueDict["venues"] = []
-        if venue.state not in state:
-            venueDict["venues"].append(addVenue(venue))
-            state.append(venue.state)
-            data.append(venueDict)
-            venueDict = {}
-        else:
-            state_index = state.index(venue.state)
-            data[state_index]["venues"].append(addVenue(venue))
-
-    return render_template('pages/venues.html', areas=data)
+    # num_upcoming_shows comes from the per-venue show counters; ?genre=,
+    # ?city=, ?state= and ?seeking= narrow the list
+    try:
+        filters = parse_facet_filters(request.args)
+    except ValueError:
+        abort(400)
+    data = get_venue_areas(**filters)
+    return render_template('pages/venues.html', areas=data,
+                           facets=get_venue_facets(**filters), filters=filters)
 
 
 @app.route('/venues/search', methods=['POST'])
@@ -124,68 +137,28 @@ def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    search_term = request.form.get('search_term')
-    search_results = Venue.query.filter(
-        Venue.name.ilike('%{}%'.format(search_term))).all()
-    data = []
-    for venue in search_results:
-        data.append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": get_upcoming_venue_shows(venue)
-        })
-
-    response = {
-        "count": len(search_results),
-        "data": data
-    }
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+    search_term = request.form.get('search_term', '')
+    try:
+        filters = parse_facet_filters(request.form)
+    except ValueError:
+        abort(400)
+    response = find_venues(search_term, page=request.form.get('page', 1, type=int), **filters)
+    upcoming_shows = count_upcoming_venue_shows([venue["id"] for venue in response["data"]])
+    for venue in response["data"]:
+        venue["num_upcoming_shows"] = upcoming_shows[venue["id"]]
+
+    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''),
+                           filters=filters, genres=GENRES)
 
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue', key='venue_id')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
-    venue = Venue.query.filter_by(id = venue_id).first()
-    data = dict()
-
-    data["id"] = venue.id
-    data["name"] = venue.name
-    data["genres"] = venue.genres
-    data["address"] = venue.address
-    data["city"] = venue.city
-    data["state"] = venue.state
-    data["phone"] = venue.phone
-    data["website"] = venue.website
-    data["facebook_link"] = venue.facebook_link
-    data["seeking_talent"] = venue.seeking_talent
-    data["seeking_description"] = venue.seeking_description if venue.seeking_description is not None else ""
-    data["image_link"] = venue.image_link
-
-    past_shows = Show.query.join(Venue).filter(Show.artist_id == venue.id).filter(Show.start_time < datetime.now())
-    upcoming_shows = Show.query.join(Venue).filter(Show.artist_id == venue.id).filter(Show.start_time > datetime.now())
-    past_shows_list = []
-    upcoming_shows_list = []
-    for past_show in past_shows:
-        show = dict()
-        show["artist_id"] = past_show.artist.id
-        show["artist_name"] = past_show.artist.name
-        show["artist_image_link"] = past_show.artist.image_link
-        show["start_time"] = str(past_show.start_time)
-        past_shows_list.append(show)
-
-    for upcoming_show in upcoming_shows:
-        show = dict()
-        show["artist_id"] = upcoming_show.artist.id
-        show["artist_name"] = upcoming_show.artist.name
-        show["artist_image_link"] = upcoming_show.artist.image_link
-        show["start_time"] = str(upcoming_show.start_time)
-        upcoming_shows_list.append(show)
-
-    data["past_shows"] = past_shows_list
-    data["upcoming_shows"] = upcoming_shows_list
-    data["past_shows_count"] = len(past_shows_list)
-    data["upcoming_shows_count"] = len(upcoming_shows_list)
+    data = get_venue_detail(venue_id)
+    if data is None:
+        abort(404)
 
     return render_template('pages/show_venue.html', venue=data)
 
@@ -223,8 +196,7 @@ def create_venue_submission():
             facebook_link = request.form.get('facebook_link')
             image_link = request.form.get('image_link')
             website_link = request.form.get('website_link')
-            seeking_talent = request.form.get('seeking_talent')
-            # seeking_talent = True if request.form.get('seeking_talent') is not None else False
+            seeking_talent = True if request.form.get('seeking_talent') is not None else False
             seeking_description = request.form.get('seeking_description')
 
             new_venue = Venue(
@@ -241,6 +213,7 @@ def create_venue_submission():
                 seeking_description=seeking_description
             )
             db.session.add(new_venue)
+            enqueue_match_refresh()
             db.session.commit()
         except:
             error = True
@@ -253,6 +226,7 @@ def create_venue_submission():
             flash('An error occurred. Venue ' + name + ' could not be listed.')
             return redirect(url_for('create_venue_form', form=form))
         else:
+            cache.invalidate('venues')
             flash('Venue ' + name + ' was successfully listed!')
             return render_template('pages/home.html')
     else:
@@ -267,8 +241,12 @@ def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
     error = False
+    name = 'with id ' + str(venue_id)
     try:
         venue = Venue.query.filter_by(id=venue_id).first()
+        # read before the session closes, or the error path can't name it
+        if venue is not None:
+            name = venue.name
         db.session.delete(venue)
         db.session.commit()
     except:
@@ -278,31 +256,33 @@ def delete_venue(venue_id):
         db.session.close()
 
     if error:
-        flash('An error occurred. Venue ' +
-              venue.name + ' could not be deleted.')
+        flash('An error occurred. Venue ' + name + ' could not be deleted.')
     else:
-        flash('Venue ' + venue.name + ' has been deleted.')
+        cache.invalidate('venues')
+        cache.invalidate('venue', venue_id)
+        # artist pages list the venue's shows
+        cache.invalidate('artist')
+        flash('Venue ' + name + ' has been deleted.')
 
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    return jsonify({"success": not error})
 
 #  Artists
 #  ----------------------------------------------------------------
 
 
 @app.route('/artists')
+@cache.cached('artists', vary=FILTER_ARGS)
 def artists():
-    # TODO: replace with real data returned from querying the database
-    data = []
-    artists = Artist.query.all()
-    for artist in artists:
-        data.append({
-            "id": artist.id,
-            "name": artist.name
-        })
-
-    return render_template('pages/artists.html', artists=data)
+    # ?genre=, ?city=, ?state= and ?seeking= narrow the list
+    try:
+        filters = parse_facet_filters(request.args)
+    except ValueError:
+        abort(400)
+    data = get_artists(**filters)
+    return render_template('pages/artists.html', artists=data,
+                           facets=get_artist_facets(**filters), filters=filters)
 
 
 @app.route('/artists/search', methods=['POST'])
@@ -310,65 +290,28 @@ def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
-    search_term = request.form.get('search_term')
-    search_results = Artist.query.filter(
-        Artist.name.ilike('%{}%'.format(search_term))).all()
-    data = []
-    for artist in search_results:
-        data.append({
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": get_upcoming_artist_shows(artist)
-        })
-
-    response = {
-        "count": len(data),
-        "data": data
-    }
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    search_term = request.form.get('search_term', '')
+    try:
+        filters = parse_facet_filters(request.form)
+    except ValueError:
+        abort(400)
+    response = find_artists(search_term, page=request.form.get('page', 1, type=int), **filters)
+    upcoming_shows = count_upcoming_artist_shows([artist["id"] for artist in response["data"]])
+    for artist in response["data"]:
+        artist["num_upcoming_shows"] = upcoming_shows[artist["id"]]
+
+    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''),
+                           filters=filters, genres=GENRES)
 
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist', key='artist_id')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # TODO: replace with real artist data from the artist table, using artist_id
-    artist = Artist.query.filter_by(id = artist_id).first()
-    data = dict()
-
-    data["id"] = artist.id
-    data["name"] = artist.name
-    data["genres"] = artist.genres
-    data["city"] = artist.city
-    data["state"] = artist.state
-    data["phone"] = artist.phone
-    data["facebook_link"] = artist.facebook_link
-    data["seeking_venue"] = artist.seeking_venue
-    data["image_link"] = artist.image_link
-    
-    past_shows = Show.query.join(Artist).filter(Show.artist_id == artist.id).filter(Show.start_time < datetime.now())
-    upcoming_shows = Show.query.join(Artist).filter(Show.artist_id == artist.id).filter(Show.start_time > datetime.now())
-    past_shows_list = []
-    upcoming_shows_list = []
-    for past_show in past_shows:
-        show = dict()
-        show["venue_id"] = past_show.venue.id
-        show["venue_name"] = past_show.venue.name
-        show["venue_image_link"] = past_show.venue.image_link
-        show["start_time"] = str(past_show.start_time)
-        past_shows_list.append(show)
-
-    for upcoming_show in upcoming_shows:
-        show = dict()
-        show["venue_id"] = upcoming_show.venue.id
-        show["venue_name"] = upcoming_show.venue.name
-        show["venue_image_link"] = upcoming_show.venue.image_link
-        show["start_time"] = str(upcoming_show.start_time)
-        upcoming_shows_list.append(show)
-
-    data["past_shows"] = past_shows_list
-    data["upcoming_shows"] = upcoming_shows_list
-    data["past_shows_count"] = len(past_shows_list)
-    data["upcoming_shows_count"] = len(upcoming_shows_list)
+    data = get_artist_detail(artist_id)
+    if data is None:
+        abort(404)
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -411,8 +354,14 @@ def edit_artist_submission(artist_id):
         artist.genres = request.form.getlist('genres')
         artist.seeking_venue = True if request.form.get('seeking_venue') is not None else False
         artist.seeking_description = request.form.get('seeking_description')
+        # venue pages list the artist's shows
+        enqueue('refresh_artist_dependents', {"artist_id": artist_id},
+                key='refresh_artist_dependents:%d' % artist_id)
+        enqueue_match_refresh()
         
         db.session.commit()
+        cache.invalidate('artists')
+        cache.invalidate('artist', artist_id)
         flash('Artist ' + artist.name + ' has been updated successfully.')
     else:
         # db.session.rollback()
@@ -462,8 +411,14 @@ def edit_venue_submission(venue_id):
         venue.genres = request.form.getlist('genres')
         venue.seeking_talent = True if request.form.get('seeking_talent') is not None else False
         venue.seeking_description = request.form.get('seeking_description')
+        # artist pages list the venue's shows
+        enqueue('refresh_venue_dependents', {"venue_id": venue_id},
+                key='refresh_venue_dependents:%d' % venue_id)
+        enqueue_match_refresh()
         
         db.session.commit()
+        cache.invalidate('venues')
+        cache.invalidate('venue', venue_id)
         flash('Venue ' + venue.name + ' has been updated successfully.')
     else:
         # db.session.rollback()
@@ -522,6 +477,7 @@ def create_artist_submission():
                 seeking_description=seeking_description
             )
             db.session.add(new_artist)
+            enqueue_match_refresh()
             db.session.commit()
         except:
             error = True
@@ -534,6 +490,7 @@ def create_artist_submission():
             flash('An error occurred. Artist ' + name + ' could not be listed.')
             return redirect(url_for('create_artist_form', form=form))
         else:
+            cache.invalidate('artists')
             flash('Artist ' + name + ' was successfully listed!')
             return render_template('pages/home.html')
     else:
@@ -546,21 +503,19 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    shows = Show.query.all()
-    data = []
-    for show in shows:
-        data.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.isoformat()
-        })
-   
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one page at a time
+    try:
+        filters = parse_show_filters(request.args)
+        data, next_cursor = get_shows_page(cursor=request.args.get('cursor'), **filters)
+    except (ValueError, OverflowError):
+        abort(400)
+
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        next_url = url_for('shows', **args)
+    return render_template('pages/shows.html', shows=data, next_url=next_url)
 
 
 @app.route('/shows/create')
@@ -582,19 +537,41 @@ def create_show_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     form = ShowForm(request.form)
     error = False
+    error_message = ''
     if form.validate():
         try:
-            artist_id = request.form.get('artist_id')
-            venue_id = request.form.get('venue_id')
-            start_time = request.form.get('start_time')
-
-            new_show = Show(
-                venue_id = venue_id,
-                artist_id = artist_id,
-                start_time = start_time
-            )
-            db.session.add(new_show)
-            db.session.commit()
+            artist_id = int(request.form.get('artist_id'))
+            venue_id = int(request.form.get('venue_id'))
+            start_time = form.start_time.data
+            duration_minutes = form.duration_minutes.data or DEFAULT_DURATION_MINUTES
+
+            conflicts = find_conflicts(venue_id, artist_id, start_time, duration_minutes)
+            if conflicts["venue"]:
+                error = True
+                error_message = 'The venue is already booked at that time.'
+            elif conflicts["artist"]:
+                error = True
+                error_message = 'The artist is already booked at that time.'
+            else:
+                new_show = Show(
+                    venue_id = venue_id,
+                    artist_id = artist_id,
+                    start_time = start_time,
+                    duration_minutes = duration_minutes
+                )
+                db.session.add(new_show)
+                db.session.commit()
+        except IntegrityError as e:
+            error = True
+            # Postgres names the constraint, SQLite lists its columns
+            if 'uq_show_venue_id_start_time' in str(e.orig) or \
+                    'ex_show_venue_id_during' in str(e.orig) or \
+                    'show.venue_id, show.start_time' in str(e.orig):
+                error_message = 'The venue is already booked at that time.'
+            elif 'ex_show_artist_id_during' in str(e.orig):
+                error_message = 'The artist is already booked at that time.'
+            db.session.rollback()
+            print(sys.exc_info())
         except:
             error = True
             db.session.rollback()
@@ -603,9 +580,12 @@ def create_show_submission():
             db.session.close()
         
         if error:
-            flash('An error occurred. Show could not be listed.')
+            flash('An error occurred. Show could not be listed. ' + error_message)
             return redirect(url_for('create_shows', form=form))
         else:
+            cache.invalidate('venues')
+            cache.invalidate('venue', int(venue_id))
+            cache.invalidate('artist', int(artist_id))
             flash('Show was successfully listed!')
             return render_template('pages/home.html')
     else:
@@ -615,6 +595,18 @@ def create_show_submission():
         return redirect(url_for('create_shows', form=form))
 
 
+@app.route('/_stats/cache')
+def cache_stats():
+    # hit/miss counters of the response cache, per namespace
+    return jsonify(cache.stats())
+
+
+@app.route('/_stats/pool')
+def pool_stats():
+    # checkout latency, saturation and connection churn per connection pool
+    return jsonify(dict((name, metrics.snapshot()) for name, metrics in pool_metrics.items()))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,262 @@
+#----------------------------------------------------------------------------#
+# Optional ASGI entry point.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The venue and artist pages and /shows are served here with async
+# SQLAlchemy (asyncpg on Postgres, aiosqlite on SQLite). A request waiting on
+# the database doesn't hold a thread, and the independent queries behind a
+# detail page (the entity, its upcoming and past shows and its suggested
+# matches) run concurrently
+# on separate connections. Everything else, and any request carrying flashed
+# messages, is passed to the Flask app unchanged. The pages are rendered
+# from the same templates and share the response cache with the WSGI app.
+#
+# A request served here runs inside one Flask request context, from the
+# before_request hooks to the teardown ones, so SQL profiling and the
+# Prometheus metrics see it as they would a WSGI request. The context is a
+# context variable, which stays with the request's task across awaits and is
+# copied into the tasks and greenlets the queries run in.
+#
+# Needs sqlalchemy[asyncio], asgiref, and asyncpg or aiosqlite; see
+# requirements-asgi.txt.
+#----------------------------------------------------------------------------#
+import asyncio
+import re
+from datetime import datetime
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template, request, session, url_for
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import app
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from queries.shows import parse_show_filters, shows_page_query, shows_page_result
+from queries.matching import SUGGESTED, suggestions_query, suggestions_to_dicts
+from utils.cache import cache
+
+ASYNC_DRIVERS = [
+    ('postgresql+psycopg2://', 'postgresql+asyncpg://'),
+    ('postgresql+psycopg://', 'postgresql+asyncpg://'),
+    ('postgresql://', 'postgresql+asyncpg://'),
+    ('postgres://', 'postgresql+asyncpg://'),
+    ('sqlite://', 'sqlite+aiosqlite://'),
+]
+
+# kind: (model, counterpart, own key, counterpart key, entity fields, template)
+DETAILS = {
+    'venue': (Venue, Artist, Show.venue_id, Show.artist_id,
+              ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+               'facebook_link', 'seeking_talent', 'seeking_description', 'image_link'),
+              'pages/show_venue.html'),
+    'artist': (Artist, Venue, Show.artist_id, Show.venue_id,
+               ('id', 'name', 'genres', 'city', 'state', 'phone', 'facebook_link',
+                'seeking_venue', 'image_link'),
+               'pages/show_artist.html'),
+}
+
+
+def async_database_uri(config):
+    uri = config.get('ASYNC_DATABASE_URL') or config['SQLALCHEMY_DATABASE_URI']
+    for prefix, driver in ASYNC_DRIVERS:
+        if uri.startswith(prefix):
+            return driver + uri[len(prefix):]
+    return uri
+
+
+def async_engine_options(config, uri):
+    # the async counterpart of utils.connection.engine_options
+    if uri.startswith('sqlite'):
+        return dict()
+    options = {
+        "pool_size": config.get('DATABASE_POOL_SIZE', 5),
+        "max_overflow": config.get('DATABASE_MAX_OVERFLOW', 10),
+        "pool_timeout": config.get('DATABASE_POOL_TIMEOUT', 30),
+        "pool_recycle": config.get('DATABASE_POOL_RECYCLE', 1800),
+        "pool_pre_ping": config.get('DATABASE_POOL_PRE_PING', True),
+        "connect_args": dict()
+    }
+    statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+    if config.get('DATABASE_PGBOUNCER'):
+        # prepared statements don't survive transaction pooling; the timeout
+        # is set per transaction by the Engine 'begin' event from init_db
+        options["connect_args"]["statement_cache_size"] = 0
+    elif statement_timeout:
+        options["connect_args"]["server_settings"] = {
+            "statement_timeout": str(statement_timeout)}
+    return options
+
+
+class AsyncApp(object):
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = None
+        self.routes = [
+            (re.compile(r'/venues/(?P<entity_id>\d+)'), self.detail_page, {"kind": 'venue'}),
+            (re.compile(r'/artists/(?P<entity_id>\d+)'), self.detail_page, {"kind": 'artist'}),
+            (re.compile(r'/shows'), self.shows_page, {}),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope["type"] == 'http' and scope["method"] in ('GET', 'HEAD'):
+            for pattern, handler, kwargs in self.routes:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    response = await self.dispatch(scope, handler, dict(kwargs, **match.groupdict()))
+                    if response is not None:
+                        return await self.respond(scope, send, response)
+                    break
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == 'lifespan.startup':
+                self.connect()
+                await send({"type": 'lifespan.startup.complete'})
+            elif message["type"] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({"type": 'lifespan.shutdown.complete'})
+                return
+
+    def connect(self):
+        # engines are bound to the event loop, so created once it runs
+        if self.engine is None:
+            uri = async_database_uri(self.flask_app.config)
+            self.engine = create_async_engine(uri, **async_engine_options(self.flask_app.config, uri))
+        return self.engine
+
+    async def fetch(self, statement):
+        # one connection per statement, so statements can run concurrently
+        async with self.connect().connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    def request_context(self, scope):
+        headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                   for name, value in scope["headers"]]
+        return self.flask_app.test_request_context(
+            scope["path"], method=scope["method"],
+            query_string=scope["query_string"].decode('latin-1'), headers=headers)
+
+    async def dispatch(self, scope, handler, kwargs):
+        # Runs handler between the app's request hooks, as Flask would run a
+        # view; None when the request is left to the Flask app.
+        ctx = self.request_context(scope)
+        ctx.push()
+        try:
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                response = await handler(**kwargs)
+                if response is None:
+                    return None
+            return self.flask_app.process_response(self.flask_app.make_response(response))
+        finally:
+            ctx.pop()
+
+    async def respond(self, scope, send, response):
+        body = response.get_data()
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.headers.items()
+                   if name.lower() != 'content-length']
+        await send({
+            "type": 'http.response.start',
+            "status": response.status_code,
+            "headers": headers + [(b'content-length', str(len(body)).encode())]
+        })
+        await send({
+            "type": 'http.response.body',
+            "body": b'' if scope["method"] == 'HEAD' else body
+        })
+
+    async def detail_page(self, kind, entity_id):
+        entity_id = int(entity_id)
+        # flashes must be consumed, and their session saved, by Flask
+        if session.get('_flashes'):
+            return None
+        cacheable = not session.get('preferences')
+        key = cache.key(kind, entity_id) if cacheable else None
+        body = cache.get_key(kind, key) if cacheable else None
+        if body is not None:
+            return body, 200
+
+        data = await self.fetch_detail(kind, entity_id)
+        if data is None:
+            return render_template('errors/404.html'), 404
+        body = render_template(DETAILS[kind][-1], **{kind: data})
+        if cacheable:
+            cache.set_key(key, body)
+        return body, 200
+
+    async def fetch_detail(self, kind, entity_id, now=None):
+        # Same result as get_venue_detail/get_artist_detail, from four
+        # queries run side by side.
+        now = now or datetime.now()
+        model, counterpart, own_key, counterpart_key, fields, _ = DETAILS[kind]
+        prefix = counterpart.__tablename__
+
+        def shows(upcoming):
+            query = select(
+                Show.id,
+                Show.start_time,
+                Show.updated_at,
+                counterpart.id.label('counterpart_id'),
+                counterpart.name.label('counterpart_name'),
+                counterpart.image_link.label('counterpart_image_link'),
+                counterpart.updated_at.label('counterpart_updated_at')
+            ).join(counterpart, counterpart.id == counterpart_key) \
+                .where(own_key == entity_id)
+            if upcoming:
+                return query.where(Show.start_time >= now).order_by(Show.start_time, Show.id)
+            return query.where(Show.start_time < now) \
+                .order_by(Show.start_time.desc(), Show.id.desc())
+
+        entity, upcoming, past, suggested = await asyncio.gather(
+            self.fetch(select(model.__table__).where(model.id == entity_id)),
+            self.fetch(shows(True)),
+            self.fetch(shows(False)),
+            self.fetch(suggestions_query(kind, entity_id)))
+        if not entity:
+            return None
+
+        row = entity[0]._mapping
+        data = dict((field, row[field]) for field in fields)
+        if 'seeking_description' in data and data["seeking_description"] is None:
+            data["seeking_description"] = ""
+        for key, rows in (('upcoming_shows', upcoming), ('past_shows', past)):
+            data[key] = [{
+                "id": show.id,
+                "updated_at": max(show.updated_at, show.counterpart_updated_at).isoformat(),
+                prefix + "_id": show.counterpart_id,
+                prefix + "_name": show.counterpart_name,
+                prefix + "_image_link": show.counterpart_image_link,
+                "start_time": show.start_time
+            } for show in rows]
+            data[key + '_count'] = len(rows)
+        data[SUGGESTED[kind]] = suggestions_to_dicts(suggested)
+        return data
+
+    async def shows_page(self):
+        if session.get('_flashes'):
+            return None
+        try:
+            filters = parse_show_filters(request.args)
+            query, per_page = shows_page_query(cursor=request.args.get('cursor'), **filters)
+        except (ValueError, OverflowError):
+            # Flask renders the 400
+            return None
+
+        data, next_cursor = shows_page_result(await self.fetch(query), per_page)
+        next_url = None
+        if next_cursor:
+            args = request.args.to_dict()
+            args["cursor"] = next_cursor
+            next_url = url_for('shows', **args)
+        return render_template('pages/shows.html', shows=data, next_url=next_url), 200
+
+
+application = AsyncApp(app)
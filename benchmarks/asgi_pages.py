@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+# ASGI page check.
+#
+# Seeds the database configured in config.py (use a scratch database!), then
+# requests the venue and artist pages, /shows with filters and the next page
+# of each through asgi.application, with httpx's ASGI client, and asserts the
+# status and body match the Flask app's for the same path, and that each
+# request was counted in the request metrics. The response cache is turned
+# off so every request reaches the database.
+#
+# Needs requirements-asgi.txt (the async dependencies and httpx).
+#
+#   python -m benchmarks.asgi_pages
+#----------------------------------------------------------------------------#
+import argparse
+import asyncio
+import re
+from html import unescape
+import httpx
+from app import app
+from asgi import application
+from utils.cache import cache, NullBackend
+from utils.metrics import registry
+from benchmarks.seed import seed
+
+NEXT_LINK = re.compile(r'href="(/shows\?[^"]*cursor=[^"]*)"')
+
+
+def requests_served():
+    return sum(value for name, labels, value in registry.snapshot()["values"]
+               if name == 'fyyur_http_requests_total')
+
+
+async def check(paths):
+    wsgi = app.test_client()
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+        paths = list(paths)
+        while paths:
+            path = paths.pop(0)
+            expected = wsgi.get(path)
+            served = requests_served()
+            response = await client.get(path)
+            assert requests_served() == served + 1, path
+            assert response.status_code == expected.status_code, \
+                (path, response.status_code, expected.status_code)
+            assert response.text == expected.get_data(as_text=True), path
+            print('%-60s %d, %d bytes' % (path, response.status_code, len(response.content)))
+            # follow /shows to its second page, cursor and filters included
+            match = NEXT_LINK.search(response.text)
+            if match and 'cursor=' not in path:
+                paths.append(unescape(match.group(1)))
+    await application.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=20)
+    parser.add_argument('--artists', type=int, default=20)
+    parser.add_argument('--shows', type=int, default=500)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, 0)
+    cache.backend = NullBackend()
+
+    asyncio.run(check([
+        '/venues/1',
+        '/artists/1',
+        '/venues/%d' % (args.venues + 1),
+        '/shows',
+        '/shows?when=past',
+        '/shows?when=upcoming&venue_id=1',
+        '/shows?artist_id=1&from=2000-01-01',
+        '/shows?from=not-a-date',
+    ]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# ASGI vs WSGI benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!) with
+# benchmarks.seed, then requests the same venue, artist and show pages from
+# --clients concurrent clients twice: through the Flask app from a pool of
+# threads, and through asgi.application as concurrent tasks on one event
+# loop. The response cache is turned off so every request reaches the
+# database. Prints throughput and p50/p95 latency for each.
+#
+# Needs requirements-asgi.txt.
+#
+#   python -m benchmarks.asgi_vs_wsgi --clients 32 --requests 2000
+#----------------------------------------------------------------------------#
+import argparse
+import asyncio
+import random
+import threading
+import time
+from app import app
+from asgi import application
+from utils.cache import cache, NullBackend
+from benchmarks.seed import seed
+from benchmarks.load_test import percentile
+
+
+def paths(rng, sizes, count):
+    choices = [
+        lambda: '/venues/%d' % rng.randint(1, sizes["venues"]),
+        lambda: '/artists/%d' % rng.randint(1, sizes["artists"]),
+        lambda: '/shows',
+    ]
+    return [rng.choice(choices)() for _ in range(count)]
+
+
+def run_wsgi(paths, clients):
+    latencies = []
+
+    def client_loop(paths):
+        client = app.test_client()
+        for path in paths:
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, path
+
+    threads = [threading.Thread(target=client_loop, args=(paths[i::clients],))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+async def asgi_get(path):
+    scope = {
+        "type": 'http',
+        "asgi": {"version": '3.0'},
+        "http_version": '1.1',
+        "method": 'GET',
+        "scheme": 'http',
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b'',
+        "root_path": '',
+        "headers": [(b'host', b'localhost')],
+        "client": ('127.0.0.1', 0),
+        "server": ('localhost', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": 'http.request', "body": b'', "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"]
+
+
+async def run_asgi(paths, clients):
+    latencies = []
+
+    async def client_loop(paths):
+        for path in paths:
+            start = time.perf_counter()
+            status = await asgi_get(path)
+            latencies.append(time.perf_counter() - start)
+            assert status == 200, path
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client_loop(paths[i::clients]) for i in range(clients)])
+    seconds = time.perf_counter() - start
+    await application.engine.dispose()
+    return latencies, seconds
+
+
+def report(label, latencies, seconds):
+    latencies = sorted(latencies)
+    print('%-5s %6d requests: %8.1f requests/s, p50 %7.2fms, p95 %7.2fms' % (
+        label, len(latencies), len(latencies) / seconds,
+        percentile(latencies, 0.50) * 1000, percentile(latencies, 0.95) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='in total, per server')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the seeded database')
+    args = parser.parse_args()
+
+    sizes = {"venues": args.venues, "artists": args.artists}
+    if not args.no_seed:
+        with app.app_context():
+            seed(args.venues, args.artists, args.shows, args.seed)
+    cache.backend = NullBackend()
+
+    requests = paths(random.Random(args.seed), sizes, args.requests)
+    report('wsgi', *run_wsgi(requests, args.clients))
+    report('asgi', *asyncio.run(run_asgi(requests, args.clients)))
+
+
+if __name__ == '__main__':
+    main()
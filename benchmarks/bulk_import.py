@@ -0,0 +1,70 @@
+#----------------------------------------------------------------------------#
+# Bulk import throughput benchmark.
+#
+# Writes a synthetic venues CSV, imports it into the database configured in
+# config.py (use a scratch database!) with `flask import` and checks the
+# throughput against a target.
+#
+#   python -m benchmarks.bulk_import --rows 200000 --target 50000
+#----------------------------------------------------------------------------#
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from app import app
+from forms import VenueForm
+from models.Venue import Venue
+from utils.connection import db
+from commands.importer import Importer, read_records
+
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL', 'FL', 'LA', 'CO']
+GENRES = ['Jazz', 'Blues', 'Folk', 'Rock n Roll', 'Soul', 'Hip-Hop']
+COLUMNS = ['name', 'city', 'state', 'address', 'phone', 'genres',
+           'facebook_link', 'website_link', 'seeking_talent', 'seeking_description']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(rows):
+            writer.writerow([
+                'Venue %d' % i, 'Springfield', random.choice(STATES),
+                '%d Main St' % i, '555-0100', ','.join(random.sample(GENRES, 2)),
+                'https://www.facebook.com/venue%d' % i, '', random.choice(['y', '']), ''
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--target', type=int, default=50000, help='rows/s')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        write_csv(path, args.rows)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            importer = Importer(Venue, VenueForm, batch_size=args.batch_size)
+            start = time.perf_counter()
+            importer.run(read_records(path, 'csv'))
+            seconds = time.perf_counter() - start
+            dialect = db.engine.dialect.name
+    finally:
+        os.remove(path)
+
+    rate = args.rows / seconds
+    print('%d rows in %.2fs: %d rows/s (%s)' % (
+        args.rows, seconds, rate, dialect))
+    assert importer.rejected == 0, importer.rejected
+    assert rate >= args.target, 'below the %d rows/s target' % args.target
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#----------------------------------------------------------------------------#
+# Datetime filter micro-benchmark.
+#
+# Renders a page of show tiles, each with a formatted start time, three ways:
+# the old filter (dateutil parsing a string, then babel resolving the
+# pattern), the current filter on a cold memo, and on a warm one, and prints
+# the cost per row. No database is needed.
+#
+#   python -m benchmarks.datetime_filter --rows 10000
+#----------------------------------------------------------------------------#
+import argparse
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+from jinja2 import Environment
+from app import app
+from utils import dates
+from benchmarks.common import timed
+
+TILES = ("{% for show in shows %}<div class=\"tile tile-show\">"
+         "<h6>{{ show.start_time|datetime('full') }}</h6></div>{% endfor %}")
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def render(template, shows):
+    with timed() as timing:
+        html = template.render(shows=shows)
+    return html, timing["seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    # one show per hour, every start time distinct
+    first = datetime(2026, 1, 1, 19, 30)
+    shows = [{"start_time": first + timedelta(hours=i)} for i in range(args.rows)]
+    stringified = [{"start_time": str(show["start_time"])} for show in shows]
+
+    legacy_env = Environment(autoescape=True)
+    legacy_env.filters['datetime'] = legacy_format_datetime
+    legacy = legacy_env.from_string(TILES)
+    current = app.jinja_env.from_string(TILES)
+
+    with app.test_request_context('/shows'):
+        expected, legacy_seconds = render(legacy, stringified)
+        dates._format.cache_clear()
+        cold_html, cold_seconds = render(current, shows)
+        warm_html, warm_seconds = render(current, shows)
+
+    assert cold_html == expected and warm_html == expected, 'output differs'
+    for label, seconds in [('legacy', legacy_seconds), ('cold', cold_seconds),
+                           ('warm', warm_seconds)]:
+        print('%-7s %d rows: %.3fs, %.2fus/row (%.1fx)' % (
+            label, args.rows, seconds, seconds / args.rows * 1e6, legacy_seconds / seconds))
+    assert cold_seconds < legacy_seconds, 'slower than the old filter'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#----------------------------------------------------------------------------#
+# Detail page query count check.
+#
+# Seeds the database configured in config.py (use a scratch database!) and
+# asserts that /venues/<id> and /artists/<id> load the entity, its shows and
+# the counterpart of every show in at most two queries, however busy it is.
+#
+#   python -m benchmarks.detail_pages --shows 5000
+#----------------------------------------------------------------------------#
+import argparse
+from app import app
+from utils.connection import db
+from benchmarks.common import count_queries, timed
+from benchmarks.seed import seed
+
+MAX_QUERIES = 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shows', type=int, default=5000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        client = app.test_client()
+        # a single venue and artist, so every show belongs to both
+        seed(1, 1, args.shows)
+        for path in ['/venues/1', '/artists/1']:
+            with count_queries(db.engine) as counter, timed() as timing:
+                response = client.get(path)
+            assert response.status_code == 200, response.status_code
+            print('%-12s %d shows: %d queries, %.3fs' %
+                  (path, args.shows, counter.count, timing["seconds"]))
+            assert counter.count <= MAX_QUERIES, counter.statements
+
+
+if __name__ == '__main__':
+    main()
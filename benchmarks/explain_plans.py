@@ -0,0 +1,70 @@
+#----------------------------------------------------------------------------#
+# Query plan check (Postgres only).
+#
+# Seeds the database configured in config.py (use a scratch database!), runs
+# the detail, /shows and counter roll-over queries, and asserts that EXPLAIN
+# shows none of them scanning the show table sequentially: show is read with
+# Index (Only) Scans, or Bitmap Heap Scans fed by Bitmap Index Scans. (The
+# directory and search pages read the per-venue counters, not show.)
+#
+#   python -m benchmarks.explain_plans --venues 10000 --shows 1000000
+#----------------------------------------------------------------------------#
+import argparse
+from app import app
+from utils.connection import db
+from benchmarks.common import count_queries
+from benchmarks.seed import seed
+from queries.venues import get_venue_detail
+from queries.artists import get_artist_detail
+from queries.shows import get_shows_page
+from utils.counters import roll_over_show_counters
+
+CHECKS = [
+    ('venue detail', lambda: get_venue_detail(1)),
+    ('artist detail', lambda: get_artist_detail(1)),
+    ('upcoming shows page', lambda: get_shows_page(when='upcoming')),
+    ('past shows page', lambda: get_shows_page(when='past')),
+    ('counter roll-over', lambda: roll_over_show_counters()),
+]
+
+
+def show_table_scans(plan):
+    # the plan lines that read the show table
+    return [line for line in plan if ' on show ' in line or line.endswith(' on show')]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        assert db.engine.dialect.name == 'postgresql', 'needs a Postgres database'
+        seed(args.venues, args.artists, args.shows)
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM ANALYZE')
+
+        failed = []
+        for name, run in CHECKS:
+            with count_queries(db.engine) as counter:
+                run()
+            db.session.rollback()
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                plan = [row[0] for row in db.session.connection().exec_driver_sql(
+                    'EXPLAIN ' + statement, parameters)]
+                scans = show_table_scans(plan)
+                ok = not any('Seq Scan' in line for line in scans)
+                print('%-6s %s' % ('ok' if ok else 'FAIL', name))
+                for line in scans:
+                    print('         ' + line.strip())
+                if not ok:
+                    failed.append(name)
+            db.session.rollback()
+
+        assert not failed, 'sequential scans on show: ' + ', '.join(failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#----------------------------------------------------------------------------#
+# Genre filter and facet count benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!), then
+# times genre (and genre + state) filtered venue listings and the facet counts
+# under the same filters, computed directly and through the cached
+# /api/v1/venues/facets endpoint. Prints the mean and p95 of each. On Postgres
+# the genre filters should read the GIN index rather than the whole table
+# (see benchmarks/explain_plans.py for checking plans).
+#
+#   python -m benchmarks.facets --venues 100000
+#----------------------------------------------------------------------------#
+import argparse
+import time
+from app import app
+from models.Venue import Venue
+from queries.facets import filter_query, get_facets
+from utils.connection import db
+from benchmarks.seed import seed, GENRES
+from benchmarks.load_test import percentile
+
+
+def time_calls(call, args_list, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            call(*args)
+            latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5, help='calls per filter')
+    args = parser.parse_args()
+
+    filters = [{"genres": [genre]} for genre, _ in GENRES]
+    filters += [{"genres": [genre], "state": 'CA'} for genre, _ in GENRES]
+
+    def listing(kwargs):
+        query = db.session.query(Venue.id, Venue.name)
+        return filter_query(query, Venue, **kwargs).all()
+
+    def cached_facets(kwargs):
+        params = [('genre', genre) for genre in kwargs["genres"]]
+        if "state" in kwargs:
+            params.append(('state', kwargs["state"]))
+        response = client.get('/api/v1/venues/facets', query_string=params)
+        assert response.status_code == 200, response.status_code
+
+    with app.app_context():
+        client = app.test_client()
+        seed(args.venues, args.artists, args.shows, 0)
+        # fill the cache, so that 'cached' times hits only
+        time_calls(cached_facets, [(kwargs,) for kwargs in filters], 1)
+        runs = [
+            ('listing', time_calls(listing, [(kwargs,) for kwargs in filters], args.repeat)),
+            ('facets', time_calls(lambda kwargs: get_facets(Venue, **kwargs),
+                                  [(kwargs,) for kwargs in filters], args.repeat)),
+            ('cached', time_calls(cached_facets, [(kwargs,) for kwargs in filters], args.repeat)),
+        ]
+
+    print('%d venues, %d filters' % (args.venues, len(filters)))
+    for label, latencies in runs:
+        print('%-8s %d calls: mean %.2fms, p95 %.2fms' % (
+            label, len(latencies), sum(latencies) / len(latencies) * 1000,
+            percentile(latencies, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#----------------------------------------------------------------------------#
+# Free-slot lookup benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!) with
+# a few very busy venues, then times get_free_slots and find_conflicts for
+# every venue over a --days window starting now, and prints the mean and p95
+# per call together with the venue's number of shows. Both only read the
+# bookings near the window, so their cost doesn't grow with a venue's
+# history.
+#
+#   python -m benchmarks.free_slots --venues 20 --shows 200000 --days 1
+#----------------------------------------------------------------------------#
+import argparse
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import app
+from models.Show import Show
+from queries.scheduling import find_conflicts, get_free_slots
+from utils.connection import db
+from benchmarks.seed import seed
+from benchmarks.load_test import percentile
+
+
+def time_calls(call, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        call(*args)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=20)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=1, help='window per lookup')
+    parser.add_argument('--repeat', type=int, default=20, help='lookups per venue')
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, 0)
+        counts = dict(db.session.query(Show.venue_id, func.count(Show.id))
+                      .group_by(Show.venue_id).all())
+        now = datetime.now().replace(second=0, microsecond=0)
+        windows = [(venue_id, now + timedelta(hours=i), now + timedelta(hours=i, days=args.days))
+                   for venue_id in counts for i in range(args.repeat)]
+
+        slots = time_calls(get_free_slots, windows)
+        conflicts = time_calls(find_conflicts, [
+            (venue_id, 1, start, 120) for venue_id, start, _ in windows])
+
+    print('%d venues, %d to %d shows each' % (len(counts), min(counts.values()), max(counts.values())))
+    for label, latencies in [('free slots', slots), ('conflicts', conflicts)]:
+        print('%-10s %d calls: mean %.3fms, p95 %.3fms' % (
+            label, len(latencies), sum(latencies) / len(latencies) * 1000,
+            percentile(latencies, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
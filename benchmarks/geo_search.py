@@ -0,0 +1,61 @@
+#----------------------------------------------------------------------------#
+# Proximity search benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!) with
+# venues spread around the seed cities, then times nearest-k and radius
+# searches for venues, and searches for upcoming shows nearby, from random
+# points around those cities. Prints p50, p95 and the slowest call of each.
+# Latency should stay flat as --venues grows.
+#
+#   python -m benchmarks.geo_search --venues 100000 --shows 200000
+#----------------------------------------------------------------------------#
+import argparse
+import random
+import time
+from app import app
+from queries.geo import find_upcoming_shows_near, find_venues_near
+from benchmarks.seed import seed, CITIES, CITY_CENTRES, CITY_SPREAD
+from benchmarks.load_test import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=500, help='per kind of search')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    weights = [weight for _, _, weight in CITIES]
+    points = []
+    for _ in range(args.queries):
+        city, state, _ = rng.choices(CITIES, weights)[0]
+        latitude, longitude = CITY_CENTRES[(city, state)]
+        points.append((rng.gauss(latitude, CITY_SPREAD * 2), rng.gauss(longitude, CITY_SPREAD * 2)))
+
+    searches = [
+        ('nearest 20', lambda lat, lng: find_venues_near(lat, lng, limit=20)),
+        ('within 5km', lambda lat, lng: find_venues_near(lat, lng, 5, limit=100)),
+        ('shows 10km', lambda lat, lng: find_upcoming_shows_near(lat, lng, 10, limit=20)),
+    ]
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, args.seed)
+        print('%d venues, %d shows' % (args.venues, args.shows))
+        for label, search in searches:
+            latencies = []
+            results = 0
+            for latitude, longitude in points:
+                start = time.perf_counter()
+                results += len(search(latitude, longitude))
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print('%-11s %d calls, %.1f results: p50 %.2fms, p95 %.2fms, max %.2fms' % (
+                label, len(latencies), results / float(len(latencies)),
+                percentile(latencies, 0.50) * 1000, percentile(latencies, 0.95) * 1000,
+                latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
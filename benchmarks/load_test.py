@@ -0,0 +1,238 @@
+#----------------------------------------------------------------------------#
+# Load test.
+#
+# Seeds the database configured in config.py (use a scratch database!) with
+# benchmarks.seed, then drives every page of the app from concurrent clients
+# with a read-heavy mix of requests, and reports p50/p95/p99 latency,
+# throughput and queries per request for each route. A form post counts as an
+# error when it is redirected back to its form or leaves an error flashed, as
+# the app reports failed submissions that way rather than with a 4xx.
+#
+# Results are saved to benchmarks/results/<commit>.json and compared with the
+# results of the baseline commit (HEAD~1 by default) if they exist: a route
+# whose p95 latency grows by more than --tolerance, or that issues more
+# queries, is reported as a regression and the run exits non-zero. Compare
+# runs made with the same sizes and --seed.
+#
+#   python -m benchmarks.load_test --clients 8 --requests 5000
+#----------------------------------------------------------------------------#
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from app import app
+from benchmarks.seed import seed, CITIES, GENRES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# the endings of the messages flashed by successful form posts
+SUCCESS_FLASHES = ('successfully listed!', 'updated successfully.')
+
+
+def _entity_form(rng, kind):
+    city, state, _ = rng.choice(CITIES)
+    data = {
+        "name": "Load test %s %d" % (kind, rng.randint(1, 10 ** 9)),
+        "city": city,
+        "state": state,
+        "phone": "555-010-%04d" % rng.randint(0, 9999),
+        "genres": [genre for genre, _ in rng.sample(GENRES, 2)],
+        "facebook_link": "https://www.facebook.com/loadtest",
+        "image_link": "",
+        "website_link": "",
+        "seeking_description": "",
+    }
+    if kind == 'venue':
+        data["address"] = "1 Main St"
+        data["seeking_talent"] = "y"
+    return data
+
+
+def _show_form(rng, sizes):
+    start = datetime.now() + timedelta(days=rng.randint(1, 365), seconds=rng.randint(0, 86399))
+    return {
+        "venue_id": str(rng.randint(1, sizes["venues"])),
+        "artist_id": str(rng.randint(1, sizes["artists"])),
+        "start_time": start.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def _term(rng):
+    return rng.choice([CITIES[0][0], 'jazz', 'rock', 'venue 1', 'ne', 'San'])
+
+
+# (route, weight, method, path(rng, sizes), form data(rng, sizes))
+ROUTES = [
+    ('/venues', 15, 'GET', lambda rng, sizes: '/venues', None),
+    ('/venues/search', 8, 'POST', lambda rng, sizes: '/venues/search',
+     lambda rng, sizes: {"search_term": _term(rng)}),
+    ('/venues/<id>', 20, 'GET',
+     lambda rng, sizes: '/venues/%d' % rng.randint(1, sizes["venues"]), None),
+    ('/artists', 10, 'GET', lambda rng, sizes: '/artists', None),
+    ('/artists/search', 8, 'POST', lambda rng, sizes: '/artists/search',
+     lambda rng, sizes: {"search_term": _term(rng)}),
+    ('/artists/<id>', 20, 'GET',
+     lambda rng, sizes: '/artists/%d' % rng.randint(1, sizes["artists"]), None),
+    ('/shows', 10, 'GET', lambda rng, sizes: '/shows', None),
+    ('/venues/create', 2, 'POST', lambda rng, sizes: '/venues/create',
+     lambda rng, sizes: _entity_form(rng, 'venue')),
+    ('/venues/<id>/edit', 2, 'POST',
+     lambda rng, sizes: '/venues/%d/edit' % rng.randint(1, sizes["venues"]),
+     lambda rng, sizes: _entity_form(rng, 'venue')),
+    ('/artists/create', 2, 'POST', lambda rng, sizes: '/artists/create',
+     lambda rng, sizes: _entity_form(rng, 'artist')),
+    ('/artists/<id>/edit', 2, 'POST',
+     lambda rng, sizes: '/artists/%d/edit' % rng.randint(1, sizes["artists"]),
+     lambda rng, sizes: _entity_form(rng, 'artist')),
+    ('/shows/create', 1, 'POST', lambda rng, sizes: '/shows/create',
+     lambda rng, sizes: _show_form(rng, sizes)),
+]
+
+
+def client_loop(rng, sizes, count, samples):
+    client = app.test_client()
+    weights = [route[1] for route in ROUTES]
+    header = {app.config.get('SQL_PROFILE_HEADER', 'X-Profile-SQL'): '1'}
+    for _ in range(count):
+        name, _, method, path, form = rng.choices(ROUTES, weights)[0]
+        data = form(rng, sizes) if form else None
+        start = time.perf_counter()
+        response = client.open(path(rng, sizes), method=method, data=data, headers=header)
+        seconds = time.perf_counter() - start
+        samples.append((name, seconds, response.status_code,
+                        int(response.headers.get('X-SQL-Queries', 0)),
+                        _failed(client, response)))
+
+
+def _failed(client, response):
+    # Redirects aren't followed, so a post's flashes are still in the
+    # session; they are cleared so they don't pile up in the cookie.
+    if response.status_code >= 400:
+        return True
+    failed = response.status_code in (302, 303) and \
+        urlsplit(response.location).path.endswith('/create')
+    with client.session_transaction() as session:
+        for _, message in session.pop('_flashes', []):
+            if not message.endswith(SUCCESS_FLASHES):
+                failed = True
+    return failed
+
+
+def percentile(values, fraction):
+    # nearest rank over sorted values
+    index = max(int(round(fraction * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(samples, seconds):
+    routes = dict()
+    for name, _, _, _, _ in ROUTES:
+        latencies = sorted(s[1] for s in samples if s[0] == name)
+        if not latencies:
+            continue
+        queries = [s[3] for s in samples if s[0] == name]
+        routes[name] = {
+            "requests": len(latencies),
+            "errors": sum(1 for s in samples if s[0] == name and s[4]),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries": sum(queries) / float(len(queries)),
+        }
+    return {"throughput": len(samples) / seconds, "routes": routes}
+
+
+def git_commit(rev='HEAD'):
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', rev], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for name, route in result["routes"].items():
+        before = baseline["routes"].get(name)
+        if not before:
+            continue
+        if route["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append('%s: p95 %.1fms -> %.1fms' % (name, before["p95_ms"], route["p95_ms"]))
+        # writes round up differently run to run; allow half a query of noise
+        if route["queries"] > before["queries"] + 0.5:
+            regressions.append('%s: %.1f -> %.1f queries per request' % (
+                name, before["queries"], route["queries"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=5000, help='in total')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--baseline', default='HEAD~1', help='commit to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed p95 growth, as a fraction')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    sizes = {"venues": args.venues, "artists": args.artists}
+    app.config['WTF_CSRF_ENABLED'] = False
+    # every request is profiled for its query count; keep the log quiet
+    app.logger.setLevel(logging.WARNING)
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, args.seed)
+
+    samples = []
+    per_client = args.requests // args.clients
+    threads = [threading.Thread(target=client_loop, args=(
+        random.Random('%s-%d' % (args.seed, i)), sizes, per_client, samples))
+        for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(samples, time.perf_counter() - start)
+
+    print('%-20s %8s %6s %9s %9s %9s %8s' % (
+        'route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for name, route in result["routes"].items():
+        print('%-20s %8d %6d %9.2f %9.2f %9.2f %8.1f' % (
+            name, route["requests"], route["errors"], route["p50_ms"],
+            route["p95_ms"], route["p99_ms"], route["queries"]))
+    print('%d clients: %.1f requests/s' % (args.clients, result["throughput"]))
+
+    commit = git_commit()
+    result.update({
+        "commit": commit,
+        "date": datetime.utcnow().isoformat(),
+        "options": vars(args),
+    })
+    if commit and not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, '%s.json' % commit), 'w') as f:
+            json.dump(result, f, indent=2)
+
+    baseline = git_commit(args.baseline)
+    path = os.path.join(RESULTS_DIR, '%s.json' % baseline)
+    if baseline and baseline != commit and os.path.exists(path):
+        with open(path) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION since %s: %s' % (baseline, regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
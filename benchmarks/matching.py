@@ -0,0 +1,65 @@
+#----------------------------------------------------------------------------#
+# Matchmaking benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!), times
+# a full compute_matches run over the catalogue, then times the suggestion
+# lookups behind the artist and venue pages and prints their mean and p95.
+# The lookups read the rank indexes only, so they don't grow with the
+# catalogue; the full run grows with seeking artists x seeking venues.
+#
+#   python -m benchmarks.matching --venues 100000 --artists 5000 --shows 200000
+#----------------------------------------------------------------------------#
+import argparse
+import random
+import time
+from app import app
+from models.Match import Match
+from queries.matching import compute_matches, get_suggested_artists, get_suggested_venues
+from utils.connection import db
+from benchmarks.seed import seed
+from benchmarks.load_test import percentile
+
+
+def time_calls(call, ids):
+    latencies = []
+    for entity_id in ids:
+        start = time.perf_counter()
+        call(entity_id)
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=1000, help='per kind of page')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, 0)
+        start = time.perf_counter()
+        written = compute_matches(args.top_k)
+        seconds = time.perf_counter() - start
+        artist_ids = [row[0] for row in db.session.query(Match.artist_id)
+                      .filter(Match.artist_rank == 1).all()]
+        venue_ids = [row[0] for row in db.session.query(Match.venue_id)
+                     .filter(Match.venue_rank == 1).all()]
+        runs = [
+            ('artist page', time_calls(get_suggested_venues, rng.choices(artist_ids, k=args.lookups))),
+            ('venue page', time_calls(get_suggested_artists, rng.choices(venue_ids, k=args.lookups))),
+        ]
+
+    print('%d venues, %d artists: %d matches for %d artists and %d venues in %.2fs' % (
+        args.venues, args.artists, written, len(artist_ids), len(venue_ids), seconds))
+    for label, latencies in runs:
+        print('%-11s %d lookups: mean %.3fms, p95 %.3fms' % (
+            label, len(latencies), sum(latencies) / len(latencies) * 1000,
+            percentile(latencies, 0.95) * 1000))
+
+
+if __name__ == '__main__':
+    main()
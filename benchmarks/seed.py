@@ -0,0 +1,169 @@
+#----------------------------------------------------------------------------#
+# Synthetic catalogue generator for the benchmarks.
+#
+# Drops and recreates every table in the database configured in config.py
+# (use a scratch database!), then fills it with venues, artists and shows
+# whose distributions look like a real listings site: a few big cities hold
+# most of the venues, a handful of genres dominate, and show bookings follow
+# a long tail where a few busy venues and artists have most of the shows.
+# Roughly 60% of the shows are in the past. No venue or artist is
+# double-booked.
+#
+# The rows are bulk inserted, past the ORM events that invalidate cached
+# pages, so every page namespace is invalidated afterwards. A server running
+# with an in-process cache still holds its old pages.
+#
+#   python -m benchmarks.seed --venues 10000 --artists 5000 --shows 1000000
+#----------------------------------------------------------------------------#
+import argparse
+import random
+from datetime import datetime, timedelta
+from app import app
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from utils.cache import cache
+from utils.connection import db
+from utils.counters import recompute_show_counters
+from queries.geo import encode_geohash
+from benchmarks.common import insert_in_batches
+
+# (city, state, relative weight), roughly by population
+CITIES = [
+    ('New York', 'NY', 88), ('Los Angeles', 'CA', 39), ('Chicago', 'IL', 27),
+    ('Houston', 'TX', 23), ('Phoenix', 'AZ', 16), ('Philadelphia', 'PA', 16),
+    ('San Antonio', 'TX', 14), ('San Diego', 'CA', 14), ('Dallas', 'TX', 13),
+    ('Austin', 'TX', 10), ('San Francisco', 'CA', 9), ('Seattle', 'WA', 7),
+    ('Denver', 'CO', 7), ('Nashville', 'TN', 7), ('Boston', 'MA', 7),
+    ('Portland', 'OR', 7), ('Detroit', 'MI', 6), ('Memphis', 'TN', 6),
+    ('New Orleans', 'LA', 4), ('Minneapolis', 'MN', 4), ('Miami', 'FL', 4),
+    ('Atlanta', 'GA', 5), ('Kansas City', 'MO', 5), ('Burlington', 'VT', 1),
+]
+# city centres for the venue coordinates
+CITY_CENTRES = {
+    ('New York', 'NY'): (40.7128, -74.0060), ('Los Angeles', 'CA'): (34.0522, -118.2437),
+    ('Chicago', 'IL'): (41.8781, -87.6298), ('Houston', 'TX'): (29.7604, -95.3698),
+    ('Phoenix', 'AZ'): (33.4484, -112.0740), ('Philadelphia', 'PA'): (39.9526, -75.1652),
+    ('San Antonio', 'TX'): (29.4241, -98.4936), ('San Diego', 'CA'): (32.7157, -117.1611),
+    ('Dallas', 'TX'): (32.7767, -96.7970), ('Austin', 'TX'): (30.2672, -97.7431),
+    ('San Francisco', 'CA'): (37.7749, -122.4194), ('Seattle', 'WA'): (47.6062, -122.3321),
+    ('Denver', 'CO'): (39.7392, -104.9903), ('Nashville', 'TN'): (36.1627, -86.7816),
+    ('Boston', 'MA'): (42.3601, -71.0589), ('Portland', 'OR'): (45.5152, -122.6784),
+    ('Detroit', 'MI'): (42.3314, -83.0458), ('Memphis', 'TN'): (35.1495, -90.0490),
+    ('New Orleans', 'LA'): (29.9511, -90.0715), ('Minneapolis', 'MN'): (44.9778, -93.2650),
+    ('Miami', 'FL'): (25.7617, -80.1918), ('Atlanta', 'GA'): (33.7490, -84.3880),
+    ('Kansas City', 'MO'): (39.0997, -94.5786), ('Burlington', 'VT'): (44.4759, -73.2121),
+}
+# venues are spread around their city centre, in degrees
+CITY_SPREAD = 0.08
+# (genre, relative weight)
+GENRES = [
+    ('Pop', 20), ('Rock n Roll', 18), ('Hip-Hop', 15), ('Electronic', 10),
+    ('R&B', 8), ('Country', 8), ('Jazz', 7), ('Alternative', 7), ('Folk', 5),
+    ('Blues', 4), ('Soul', 4), ('Punk', 4), ('Heavy Metal', 4), ('Reggae', 3),
+    ('Funk', 3), ('Classical', 3), ('Instrumental', 2), ('Musical Theatre', 2),
+    ('Other', 1),
+]
+STREETS = ['Main', 'Oak', 'Pine', 'Elm', 'Market', 'Church', 'Mill']
+PAST_FRACTION = 0.6
+# how heavy the long tail of bookings is; lower is more skewed
+POPULARITY_SHAPE = 1.2
+# (show length in minutes, relative weight)
+DURATIONS = [(60, 2), (90, 3), (120, 4), (180, 1)]
+
+
+def _genres(rng, genres, weights):
+    picked = set(rng.choices(genres, weights, k=rng.choice((1, 1, 2, 2, 3))))
+    return sorted(picked)
+
+
+def _popularity(rng, count):
+    # Pareto-distributed booking weights
+    return [rng.paretovariate(POPULARITY_SHAPE) for _ in range(count)]
+
+
+def entities(rng, kind, count):
+    cities = [(city, state) for city, state, _ in CITIES]
+    city_weights = [weight for _, _, weight in CITIES]
+    genres = [genre for genre, _ in GENRES]
+    genre_weights = [weight for _, weight in GENRES]
+    for i in range(1, count + 1):
+        city, state = rng.choices(cities, city_weights)[0]
+        row = {
+            "id": i,
+            "name": "%s %s %d" % (rng.choice(genres), kind.title(), i),
+            "city": city,
+            "state": state,
+            "phone": "%03d-%03d-%04d" % (rng.randint(200, 999), rng.randint(200, 999),
+                                         rng.randint(0, 9999)),
+            "genres": _genres(rng, genres, genre_weights),
+            "facebook_link": "https://www.facebook.com/%s%d" % (kind, i),
+            "seeking_description": "",
+        }
+        if kind == 'venue':
+            row["address"] = "%d %s St" % (rng.randint(1, 9999), rng.choice(STREETS))
+            row["seeking_talent"] = rng.random() < 0.3
+            latitude, longitude = CITY_CENTRES[(city, state)]
+            row["latitude"] = round(rng.gauss(latitude, CITY_SPREAD), 6)
+            row["longitude"] = round(rng.gauss(longitude, CITY_SPREAD), 6)
+            row["geohash"] = encode_geohash(row["latitude"], row["longitude"])
+        else:
+            row["seeking_venue"] = rng.random() < 0.4
+        yield row
+
+
+def shows(rng, num_venues, num_artists, num_shows, now=None):
+    # Shows start on distinct minutes and end before the next show of their
+    # venue and of their artist starts, so nothing is double-booked.
+    now = now or datetime.now()
+    venue_weights = _popularity(rng, num_venues)
+    artist_weights = _popularity(rng, num_artists)
+    # spread over at least a year
+    span = max(num_shows * 2, 365 * 24 * 60)
+    first_show = now - timedelta(minutes=int(span * PAST_FRACTION))
+    minutes = rng.sample(range(span), num_shows)
+    venues = rng.choices(range(1, num_venues + 1), venue_weights, k=num_shows)
+    artists = rng.choices(range(1, num_artists + 1), artist_weights, k=num_shows)
+    durations = rng.choices([length for length, _ in DURATIONS],
+                            [weight for _, weight in DURATIONS], k=num_shows)
+    for owners in (venues, artists):
+        order = sorted(range(num_shows), key=lambda i: (owners[i], minutes[i]))
+        for i, following in zip(order, order[1:]):
+            if owners[i] == owners[following]:
+                durations[i] = min(durations[i], minutes[following] - minutes[i])
+    for i in range(num_shows):
+        yield {
+            "venue_id": venues[i],
+            "artist_id": artists[i],
+            "start_time": first_show + timedelta(minutes=minutes[i]),
+            "duration_minutes": durations[i]
+        }
+
+
+def seed(num_venues, num_artists, num_shows, random_seed=None):
+    rng = random.Random(random_seed)
+    db.drop_all()
+    db.create_all()
+    insert_in_batches(Venue.__table__, entities(rng, 'venue', num_venues))
+    insert_in_batches(Artist.__table__, entities(rng, 'artist', num_artists))
+    insert_in_batches(Show.__table__, shows(rng, num_venues, num_artists, num_shows))
+    recompute_show_counters()
+    for namespace in ('venues', 'venue', 'artists', 'artist'):
+        cache.invalidate(namespace)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows, args.seed)
+    print('%d venues, %d artists, %d shows' % (args.venues, args.artists, args.shows))
+
+
+if __name__ == '__main__':
+    main()
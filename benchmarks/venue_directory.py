@@ -0,0 +1,49 @@
+#----------------------------------------------------------------------------#
+# Venue directory benchmark.
+#
+# Seeds the database configured in config.py (use a scratch database!) with
+# synthetic venues and shows, then renders /venues and checks that the number
+# of queries does not grow with the number of venues. The response cache is
+# turned off so every request reaches the database.
+#
+#   python -m benchmarks.venue_directory --venues 10000 --shows 1000000
+#----------------------------------------------------------------------------#
+import argparse
+from app import app
+from utils.cache import cache, NullBackend
+from utils.connection import db
+from benchmarks.common import count_queries, timed
+from benchmarks.seed import seed
+
+def run(client, path):
+    with count_queries(db.engine) as counter, timed() as timing:
+        response = client.get(path)
+    assert response.status_code == 200, response.status_code
+    return counter.count, timing["seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    cache.backend = NullBackend()
+    with app.app_context():
+        client = app.test_client()
+        results = []
+        # a small catalogue first, then the full size, so the query counts
+        # can be compared
+        for num_venues, num_shows in [(10, 100), (args.venues, args.shows)]:
+            seed(num_venues, args.artists, num_shows)
+            queries, seconds = run(client, '/venues')
+            results.append(queries)
+            print('%7d venues %8d shows: %d queries, %.3fs' %
+                  (num_venues, num_shows, queries, seconds))
+
+        assert len(set(results)) == 1, 'query count grows with catalogue size'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from utils.assets import build_app_assets
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Bundle, fingerprint and precompress the static CSS and JavaScript.
+
+    Run this as part of every deploy, before the new processes start.
+    """
+    manifest = build_app_assets(current_app._get_current_object())
+    for name, filename in sorted(manifest.items()):
+        click.echo('%s -> %s' % (name, filename))
@@ -0,0 +1,24 @@
+import click
+from flask.cli import with_appcontext
+from utils.counters import recompute_show_counters, roll_over_show_counters
+from utils.cache import cache
+
+
+@click.command('rollover-shows')
+@click.option('--full', is_flag=True,
+              help='Recompute every counter from scratch instead of rolling over.')
+@with_appcontext
+def rollover_shows_command(full):
+    """Move shows that have started from the upcoming to the past counters.
+
+    The job queue already does this every SHOW_COUNTERS_ROLLOVER_SECONDS;
+    the upcoming counts shown on list pages are as fresh as the last run.
+    The cached pages invalidated here are those of a shared cache only, as
+    this process has its own in-process one.
+    """
+    if full:
+        recompute_show_counters()
+    else:
+        roll_over_show_counters()
+    cache.invalidate('venues')
+    click.echo('Show counters updated.')
@@ -0,0 +1,192 @@
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+#   flask export --format jsonl --compress gzip --output snapshots/
+#   flask export shows --since 2026-10-01T00:00:00 --format parquet
+#
+# Rows are streamed from a server-side cursor in chunks and written out as
+# they arrive, so memory use stays flat however large the tables are. With
+# --since only rows whose updated_at is at or after the given time are
+# exported; the command prints the watermark to pass as --since next time.
+# Deleted rows are not tracked, so incremental exports only carry inserts and
+# updates.
+#
+# Parquet needs the pyarrow package and zstd compression the zstandard
+# package (see requirements-optional.txt); neither is needed for the other
+# formats.
+#----------------------------------------------------------------------------#
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+import click
+import dateutil.parser
+from flask.cli import with_appcontext
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from utils.connection import db
+
+EXPORTS = {
+    "venues": Venue,
+    "artists": Artist,
+    "shows": Show
+}
+EXTENSIONS = {
+    "gzip": '.gz',
+    "zstd": '.zst',
+    "none": ''
+}
+
+
+def open_compressed(path, compress):
+    if compress == 'gzip':
+        return gzip.open(path, 'wb')
+    if compress == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+def to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ','.join(value)
+    return value
+
+
+def to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class CSVWriter(object):
+    def __init__(self, path, columns, compress):
+        self.stream = io.TextIOWrapper(open_compressed(path, compress),
+                                       encoding='utf-8', newline='')
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow([column.name for column in columns])
+
+    def write(self, rows):
+        self.writer.writerows([to_text(value) for value in row] for row in rows)
+
+    def close(self):
+        self.stream.close()
+
+
+class JSONLWriter(object):
+    def __init__(self, path, columns, compress):
+        self.stream = io.TextIOWrapper(open_compressed(path, compress), encoding='utf-8')
+        self.columns = [column.name for column in columns]
+
+    def write(self, rows):
+        self.stream.writelines(
+            json.dumps(dict(zip(self.columns, map(to_json, row)))) + '\n' for row in rows)
+
+    def close(self):
+        self.stream.close()
+
+
+class ParquetWriter(object):
+    # One row group per chunk; compression is applied inside the file. The
+    # schema comes from the column types rather than the first chunk, where a
+    # column that happens to be all null would be typed null.
+    def __init__(self, path, columns, compress):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.columns = [column.name for column in columns]
+        self.schema = pyarrow.schema([
+            (column.name, self.arrow_type(column.type.python_type)) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression=compress)
+
+    def arrow_type(self, python_type):
+        types = {
+            int: self.pyarrow.int64(),
+            float: self.pyarrow.float64(),
+            bool: self.pyarrow.bool_(),
+            str: self.pyarrow.string(),
+            datetime: self.pyarrow.timestamp('us'),
+            # genres
+            list: self.pyarrow.list_(self.pyarrow.string())
+        }
+        return types[python_type]
+
+    def write(self, rows):
+        self.writer.write_table(self.pyarrow.Table.from_pylist(
+            [dict(zip(self.columns, row)) for row in rows], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "jsonl": JSONLWriter,
+    "parquet": ParquetWriter
+}
+
+
+def export_table(model, writer_class, path, compress, since=None, chunk_size=10000):
+    # Streams the rows of model's table into path; returns the number of rows
+    # and the latest updated_at written.
+    columns = list(model.__table__.columns)
+    query = db.session.query(*model.__table__.columns).order_by(model.id)
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+
+    writer = writer_class(path, columns, compress)
+    count = 0
+    watermark = None
+    chunk = []
+    try:
+        for row in query.yield_per(chunk_size):
+            chunk.append(tuple(row))
+            if watermark is None or row.updated_at > watermark:
+                watermark = row.updated_at
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count, watermark
+
+
+@click.command('export')
+@click.argument('kinds', nargs=-1, type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(WRITERS)), default='jsonl',
+              show_default=True)
+@click.option('--compress', type=click.Choice(sorted(EXTENSIONS)), default='none',
+              show_default=True)
+@click.option('--output', type=click.Path(file_okay=False), default='.',
+              show_default=True, help='Directory to write the files to.')
+@click.option('--since', help='Only export rows updated at or after this ISO timestamp (UTC).')
+@click.option('--chunk-size', default=10000, show_default=True,
+              help='Rows fetched from the database and written per chunk.')
+@with_appcontext
+def export_command(kinds, fmt, compress, output, since, chunk_size):
+    """Export venues, artists and shows (all by default) to CSV, JSONL or Parquet."""
+    since = dateutil.parser.parse(since) if since else None
+    os.makedirs(output, exist_ok=True)
+    extension = '.' + fmt + ('' if fmt == 'parquet' else EXTENSIONS[compress])
+    suffix = since.strftime('-since-%Y%m%dT%H%M%S') if since else ''
+
+    watermarks = []
+    for kind in kinds or sorted(EXPORTS):
+        path = os.path.join(output, kind + suffix + extension)
+        count, watermark = export_table(EXPORTS[kind], WRITERS[fmt], path, compress,
+                                        since=since, chunk_size=chunk_size)
+        db.session.rollback()
+        if watermark is not None:
+            watermarks.append(watermark)
+        click.echo('Exported %d %s to %s' % (count, kind, path))
+    if watermarks:
+        click.echo('Next incremental export: --since %s' % max(watermarks).isoformat())
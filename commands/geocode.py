@@ -0,0 +1,102 @@
+#----------------------------------------------------------------------------#
+# Offline geocoding.
+#
+#   flask geocode gazetteer.csv
+#   flask geocode cities15000.txt --all
+#
+# Places venues using a local gazetteer, without any network calls. Either:
+#
+# - a CSV file with city, state, latitude and longitude columns, plus an
+#   optional address column for entries more precise than a city, or
+# - a GeoNames dump (cities500.txt, cities15000.txt, ... from
+#   download.geonames.org), where the state is the admin1 code, i.e. the
+#   two-letter state code for the US.
+#
+# A venue takes the coordinates of its address if the gazetteer has them,
+# else those of its city. Only venues without coordinates are placed unless
+# --all is given. Venues whose address changes lose their coordinates (see
+# queries/geo.py), so run this after imports and periodically.
+#----------------------------------------------------------------------------#
+import csv
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam
+from models.Venue import Venue
+from queries.geo import encode_geohash
+from utils.connection import db
+
+GEONAMES_COLUMNS = 19
+
+
+def _key(*parts):
+    return tuple(' '.join((part or '').lower().split()) for part in parts)
+
+
+def load_gazetteer(path):
+    # {(city, state): (lat, lng)} and {(address, city, state): (lat, lng)},
+    # with normalised keys
+    cities = dict()
+    addresses = dict()
+    with open(path, newline='', encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        if first.count('\t') >= GEONAMES_COLUMNS - 1:
+            # the most populous place wins when several share a name
+            populations = dict()
+            for fields in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                location = (float(fields[4]), float(fields[5]))
+                population = int(fields[14] or 0)
+                for name in set([fields[1], fields[2]]):
+                    key = _key(name, fields[10])
+                    if population >= populations.get(key, -1):
+                        populations[key] = population
+                        cities[key] = location
+        else:
+            for row in csv.DictReader(f):
+                location = (float(row['latitude']), float(row['longitude']))
+                if row.get('address'):
+                    addresses[_key(row['address'], row['city'], row['state'])] = location
+                else:
+                    cities[_key(row['city'], row['state'])] = location
+    return cities, addresses
+
+
+@click.command('geocode')
+@click.argument('gazetteer', type=click.Path(exists=True, dir_okay=False))
+@click.option('--all', 'everything', is_flag=True,
+              help='Place every venue again, not only those without coordinates.')
+@click.option('--batch-size', default=5000, show_default=True)
+@with_appcontext
+def geocode_command(gazetteer, everything, batch_size):
+    """Set venue coordinates from a local gazetteer file."""
+    cities, addresses = load_gazetteer(gazetteer)
+    table = Venue.__table__
+    query = db.session.query(Venue.id, Venue.address, Venue.city, Venue.state).order_by(Venue.id)
+    if not everything:
+        query = query.filter(Venue.latitude.is_(None))
+    update = table.update() \
+        .where(table.c.id == bindparam('venue_id')) \
+        .values(latitude=bindparam('lat'), longitude=bindparam('lng'),
+                geohash=bindparam('cell'), updated_at=bindparam('now'))
+
+    now = datetime.utcnow()
+    placed = 0
+    unmatched = 0
+    batch = []
+    for venue_id, address, city, state in query.all():
+        location = addresses.get(_key(address, city, state)) or cities.get(_key(city, state))
+        if location is None:
+            unmatched += 1
+            continue
+        batch.append({"venue_id": venue_id, "lat": location[0], "lng": location[1],
+                      "cell": encode_geohash(*location), "now": now})
+        if len(batch) >= batch_size:
+            db.session.execute(update, batch)
+            placed += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(update, batch)
+        placed += len(batch)
+    db.session.commit()
+    click.echo('Placed %d venues; %d not found in the gazetteer.' % (placed, unmatched))
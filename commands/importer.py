@@ -0,0 +1,384 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+#   flask import venues venues.csv
+#   flask import shows shows.jsonl --batch-size 20000 --rejects rejects.jsonl
+#
+# Rows are checked against the same rules as the VenueForm, ArtistForm and
+# ShowForm used by the create pages, then checked against the database a
+# batch at a time: the venue and artist of a show must exist, and a show
+# may not overlap another booking of its venue or artist, stored or earlier
+# in the import. Rows are then written in batches: COPY on Postgres,
+# executemany everywhere else. A batch the database still refuses is retried
+# row by row so only the offending rows are rejected. Rejected rows are
+# written as JSON lines with their errors.
+#
+# CSV columns and JSON keys are the form field names, plus an optional id.
+# In CSV files genres are separated by commas within the cell.
+#----------------------------------------------------------------------------#
+import csv
+import io
+import json
+import sys
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+from wtforms.fields import BooleanField, DateTimeField, IntegerField, SelectField, SelectMultipleField
+from wtforms.validators import AnyOf, DataRequired, InputRequired, NumberRange, Optional, URL
+from forms import ArtistForm, ShowForm, VenueForm
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from queries.scheduling import load_calendars
+from utils.connection import db
+from utils.cache import cache
+from utils.counters import recompute_show_counters
+
+# form field name -> model column name, where they differ
+RENAMED_FIELDS = {
+    "website_link": "website"
+}
+# columns the models require that the forms leave optional
+COLUMN_DEFAULTS = {
+    "phone": ''
+}
+# foreign key column -> (model, error)
+REFERENCES = {
+    "venue_id": (Venue, 'No such venue.'),
+    "artist_id": (Artist, 'No such artist.')
+}
+# owner column -> error of a show overlapping another of the same owner
+BOOKING_CONFLICTS = {
+    "venue_id": 'The venue is already booked at that time.',
+    "artist_id": 'The artist is already booked at that time.'
+}
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+
+
+class RowValidator(object):
+    # Applies a form's field types and validators to plain dicts. Building and
+    # validating a WTForms form costs ~100us per row, which dominates a bulk
+    # import, so the rules are read off the form once up front. Rows using a
+    # validator this class doesn't know are validated by the form itself.
+
+    def __init__(self, form_class):
+        self.form_class = form_class
+        self.form = form_class(formdata=None, meta={'csrf': False})
+        self.fields = [field for field in self.form if field.type != 'CSRFTokenField']
+        self.choices = dict(
+            (field.name, frozenset(choice[0] for choice in field.choices))
+            for field in self.fields
+            if isinstance(field, (SelectField, SelectMultipleField)))
+
+    def validate(self, record):
+        values = dict()
+        errors = dict()
+        for field in self.fields:
+            try:
+                values[field.name] = self._validate_field(field, record.get(field.name))
+            except ValueError as e:
+                errors[field.name] = str(e)
+            except NotImplementedError:
+                return self._validate_with_form(record)
+        if 'id' in record and record['id'] not in (None, ''):
+            try:
+                values['id'] = int(record['id'])
+            except ValueError:
+                errors['id'] = 'Not a valid integer.'
+        return values, errors
+
+    def _validate_field(self, field, value):
+        if isinstance(field, SelectMultipleField):
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(',') if item.strip()]
+            value = list(value or [])
+        elif isinstance(field, BooleanField):
+            return str(value).strip().lower() in TRUE_VALUES if value is not None else False
+        elif value is not None:
+            value = str(value).strip()
+
+        if isinstance(field, IntegerField) and value:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError('Not a valid integer value.')
+
+        for validator in field.validators:
+            if isinstance(validator, Optional):
+                if value in (None, ''):
+                    return None
+            elif isinstance(validator, (DataRequired, InputRequired)):
+                if not value:
+                    raise ValueError('This field is required.')
+            elif isinstance(validator, URL):
+                if value and not validator.regex.match(value):
+                    raise ValueError('Invalid URL.')
+            elif isinstance(validator, AnyOf):
+                if value not in validator.values:
+                    raise ValueError('Invalid value.')
+            elif isinstance(validator, NumberRange):
+                if value is not None and not (
+                        (validator.min is None or value >= validator.min) and
+                        (validator.max is None or value <= validator.max)):
+                    raise ValueError('Number must be between %s and %s.' % (
+                        validator.min, validator.max))
+            else:
+                raise NotImplementedError(type(validator).__name__)
+
+        if field.name in self.choices and value:
+            chosen = value if isinstance(value, list) else [value]
+            if not self.choices[field.name].issuperset(chosen):
+                raise ValueError('Not a valid choice.')
+        if isinstance(field, DateTimeField) and value:
+            formats = field.format if isinstance(field.format, list) else [field.format]
+            for fmt in formats:
+                try:
+                    return datetime.strptime(value, fmt)
+                except ValueError:
+                    pass
+            raise ValueError('Not a valid datetime value.')
+        return value or None
+
+    def _validate_with_form(self, record):
+        formdata = MultiDict()
+        for key, value in record.items():
+            if isinstance(value, list):
+                formdata.setlist(key, value)
+            elif value is not None:
+                formdata[key] = str(value)
+        form = self.form_class(formdata=formdata, meta={'csrf': False})
+        if not form.validate():
+            return None, dict((key, errors[0]) for key, errors in form.errors.items())
+        values = form.data
+        values.pop('csrf_token', None)
+        if record.get('id') not in (None, ''):
+            values['id'] = int(record['id'])
+        return values, dict()
+
+
+class Importer(object):
+    def __init__(self, model, form_class, batch_size=5000, rejects=None):
+        self.model = model
+        self.table = model.__table__
+        self.validator = RowValidator(form_class)
+        self.batch_size = batch_size
+        self.rejects = rejects
+        self.imported = 0
+        self.rejected = 0
+
+    def to_row(self, values, now):
+        row = dict()
+        for key, value in values.items():
+            key = RENAMED_FIELDS.get(key, key)
+            if key in self.table.c:
+                column = self.table.c[key]
+                if value is None and column.default is not None and column.default.is_scalar:
+                    # COPY and executemany don't apply column defaults
+                    value = column.default.arg
+                row[key] = value
+        for key, default in COLUMN_DEFAULTS.items():
+            # an empty field validates to None, which the column refuses
+            if key in self.table.c and row.get(key) is None:
+                row[key] = default
+        for key in ('venue_id', 'artist_id'):
+            if key in self.table.c and row.get(key) is not None:
+                row[key] = int(row[key])
+        row['updated_at'] = now
+        return row
+
+    def reject(self, line, record, errors):
+        self.rejected += 1
+        if self.rejects is not None:
+            self.rejects.write(json.dumps({
+                "line": line, "record": record, "errors": errors
+            }, default=str) + '\n')
+
+    def run(self, records):
+        now = datetime.utcnow()
+        batch = []
+        for line, record in records:
+            try:
+                values, errors = self.validator.validate(record)
+                row = self.to_row(values, now) if not errors else None
+            except (TypeError, ValueError) as e:
+                errors = {"row": str(e)}
+            if errors:
+                self.reject(line, record, errors)
+                continue
+            batch.append((line, record, row))
+            if len(batch) >= self.batch_size:
+                self.flush(self.check(batch))
+                batch = []
+        if batch:
+            self.flush(self.check(batch))
+        self.finish()
+
+    def check(self, batch):
+        # the rows of batch that pass the checks needing the database; the
+        # others are rejected
+        for key, (model, error) in REFERENCES.items():
+            if key not in self.table.c:
+                continue
+            ids = set(row[key] for _, _, row in batch)
+            existing = set(row[0] for row in db.session.query(model.id).filter(model.id.in_(ids)))
+            batch = self.reject_where(batch, lambda row: row[key] not in existing, {key: error})
+        if self.model is Show and batch:
+            batch = self.check_bookings(batch)
+        return batch
+
+    def check_bookings(self, batch):
+        # One query per owner column loads the bookings around the batch;
+        # rows are then checked in file order against those and against the
+        # rows of the batch already accepted, kept per owner as sorted,
+        # non-overlapping (start, end) lists.
+        minute = timedelta(minutes=1)
+        spans = [(row['start_time'], row['start_time'] + row['duration_minutes'] * minute)
+                 for _, _, row in batch]
+        start = min(span[0] for span in spans)
+        end = max(span[1] for span in spans)
+        calendars = dict(
+            (key, load_calendars(self.table.c[key], set(row[key] for _, _, row in batch),
+                                 start, end))
+            for key in BOOKING_CONFLICTS)
+        accepted = dict((key, dict()) for key in BOOKING_CONFLICTS)
+        kept = []
+        for (line, record, row), (start_time, end_time) in zip(batch, spans):
+            errors = dict()
+            for key, error in BOOKING_CONFLICTS.items():
+                booked = accepted[key].setdefault(row[key], [])
+                i = bisect_left(booked, (end_time,))
+                if calendars[key][row[key]].overlapping(start_time, end_time) or \
+                        (i > 0 and booked[i - 1][1] > start_time):
+                    errors[key] = error
+            if errors:
+                self.reject(line, record, errors)
+                continue
+            for key in BOOKING_CONFLICTS:
+                insort(accepted[key][row[key]], (start_time, end_time))
+            kept.append((line, record, row))
+        return kept
+
+    def reject_where(self, batch, refused, errors):
+        kept = []
+        for line, record, row in batch:
+            if refused(row):
+                self.reject(line, record, errors)
+            else:
+                kept.append((line, record, row))
+        return kept
+
+    def flush(self, batch):
+        if not batch:
+            return
+        columns = sorted(set().union(*(row.keys() for _, _, row in batch)))
+        try:
+            with db.session.begin_nested():
+                self.write([row for _, _, row in batch], columns)
+            db.session.commit()
+            self.imported += len(batch)
+        except DBAPIError:
+            db.session.rollback()
+            self.flush_rows(batch, columns)
+
+    def flush_rows(self, batch, columns):
+        # isolate the rows the database refuses
+        for line, record, row in batch:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(self.table.insert(), [row])
+                self.imported += 1
+            except DBAPIError as e:
+                self.reject(line, record, {"database": str(e.orig).strip()})
+        db.session.commit()
+
+    def write(self, rows, columns):
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            self.copy(connection, rows, columns)
+        else:
+            connection.execute(self.table.insert(), rows)
+
+    def copy(self, connection, rows, columns):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([copy_value(row.get(column)) for column in columns])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                self.table.name, ', '.join('"%s"' % column for column in columns)), buffer)
+        finally:
+            cursor.close()
+
+    def finish(self):
+        if db.session.connection().dialect.name == 'postgresql':
+            # explicit ids don't advance the id sequence
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                "coalesce(max(id), 0) + 1, false) FROM \"{}\"".format(self.table.name)),
+                {"table": self.table.name})
+            db.session.commit()
+
+
+def copy_value(value):
+    # formats a value for COPY ... (FORMAT csv); None becomes NULL
+    if isinstance(value, list):
+        return '{%s}' % ','.join(
+            '"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def read_records(path, fmt):
+    # yields (line number, record dict)
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for line, record in enumerate(csv.DictReader(f), start=2):
+                yield line, record
+        else:
+            for line, text in enumerate(f, start=1):
+                if text.strip():
+                    yield line, json.loads(text)
+
+
+IMPORTS = {
+    "venues": (Venue, VenueForm),
+    "artists": (Artist, ArtistForm),
+    "shows": (Show, ShowForm)
+}
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows written per COPY / executemany.')
+@click.option('--rejects', type=click.File('w'),
+              help='Where to write rejected rows as JSON lines (default stderr).')
+@with_appcontext
+def import_command(kind, path, fmt, batch_size, rejects):
+    """Bulk import venues, artists or shows from a CSV or JSONL file."""
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    rejects = rejects or sys.stderr
+    model, form_class = IMPORTS[kind]
+    importer = Importer(model, form_class, batch_size=batch_size, rejects=rejects)
+    start = time.perf_counter()
+    importer.run(read_records(path, fmt))
+    seconds = time.perf_counter() - start
+    if kind == 'shows':
+        # COPY and executemany bypass the ORM events that maintain the counters
+        recompute_show_counters()
+    for namespace in ('venues', 'venue', 'artists', 'artist'):
+        cache.invalidate(namespace)
+    click.echo('Imported %d %s, rejected %d in %.1fs (%d rows/s)' % (
+        importer.imported, kind, importer.rejected, seconds,
+        (importer.imported + importer.rejected) / seconds if seconds else 0))
@@ -0,0 +1,20 @@
+import click
+from flask.cli import with_appcontext
+from queries.matching import compute_matches
+from utils.cache import cache
+
+
+@click.command('compute-matches')
+@click.option('--top-k', type=int, default=None,
+              help='Suggestions kept per artist and per venue (default MATCHES_PER_ENTITY).')
+@with_appcontext
+def compute_matches_command(top_k):
+    """Recompute the suggested venues of artists and artists of venues.
+
+    Edits to venues and artists queue a recomputation; run this too
+    periodically (e.g. nightly from cron) so past shows count.
+    """
+    written = compute_matches(top_k)
+    cache.invalidate('venue')
+    cache.invalidate('artist')
+    click.echo('Stored %d matches.' % written)
@@ -0,0 +1,32 @@
+import threading
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from utils.jobs import work
+
+
+@click.command('worker')
+@click.option('--threads', default=1, show_default=True, help='Jobs run concurrently.')
+@click.option('--burst', is_flag=True, help='Exit once no jobs are due.')
+@with_appcontext
+def worker_command(threads, burst):
+    """Run queued background jobs.
+
+    Any number of workers can run against the same database. Tasks that
+    touch the response cache need a shared cache (CACHE_TYPE=redis) to
+    reach the web processes.
+    """
+    app = current_app._get_current_object()
+    counts = []
+    workers = [threading.Thread(target=lambda: counts.append(work(app, burst=burst)))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(1)
+    except KeyboardInterrupt:
+        pass
+    click.echo('%d jobs processed.' % sum(counts))
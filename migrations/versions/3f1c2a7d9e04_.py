@@ -0,0 +1,42 @@
+"""add trigram search indexes to venue and artist
+
+Revision ID: 3f1c2a7d9e04
+Revises: 549b57319801
+Create Date: 2026-10-18 09:12:40.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9e04'
+down_revision = '549b57319801'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is only STABLE, so wrap it in an IMMUTABLE function
+    # that can be used in an index expression
+    op.execute("""
+        CREATE OR REPLACE FUNCTION fyyur_genres_text(varchar[]) RETURNS text
+        AS $$ SELECT array_to_string($1, ' ') $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    """)
+    for table in ('venue', 'artist'):
+        for column in ('name', 'city', 'state'):
+            op.execute(
+                'CREATE INDEX ix_{0}_{1}_trgm ON {0} '
+                'USING gin ({1} gin_trgm_ops)'.format(table, column))
+        op.execute(
+            'CREATE INDEX ix_{0}_genres_trgm ON {0} '
+            'USING gin (fyyur_genres_text(genres) gin_trgm_ops)'.format(table))
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        for column in ('name', 'city', 'state', 'genres'):
+            op.drop_index('ix_{0}_{1}_trgm'.format(table, column), table_name=table)
+    op.execute('DROP FUNCTION IF EXISTS fyyur_genres_text(varchar[])')
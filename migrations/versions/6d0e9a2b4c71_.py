@@ -0,0 +1,30 @@
+"""add genre GIN indexes and state/city indexes to venue and artist
+
+Revision ID: 6d0e9a2b4c71
+Revises: e2b47c90d1f8
+Create Date: 2026-10-18 23:58:07.631492
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d0e9a2b4c71'
+down_revision = 'e2b47c90d1f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        # answers genres @> ARRAY[...] (see queries/facets.py)
+        op.create_index('ix_{0}_genres'.format(table), table, ['genres'],
+                        unique=False, postgresql_using='gin')
+        op.create_index('ix_{0}_state_city'.format(table), table, ['state', 'city'], unique=False)
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index('ix_{0}_state_city'.format(table), table_name=table)
+        op.drop_index('ix_{0}_genres'.format(table), table_name=table)
@@ -0,0 +1,40 @@
+"""add show durations and reject overlapping bookings
+
+Revision ID: c5d81e3f6a29
+Revises: a7c4e2d91b36
+Create Date: 2026-10-18 22:04:17.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d81e3f6a29'
+down_revision = 'a7c4e2d91b36'
+branch_labels = None
+depends_on = None
+
+SHOW_DURING = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+EXCLUSION_CONSTRAINTS = {
+    'ex_show_venue_id_during': 'venue_id',
+    'ex_show_artist_id_during': 'artist_id',
+}
+
+
+def upgrade():
+    op.add_column('show', sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False))
+    op.create_check_constraint('ck_show_duration_minutes', 'show',
+                               'duration_minutes BETWEEN 1 AND 1440')
+    # fails if existing shows overlap; move or shorten them first
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in EXCLUSION_CONSTRAINTS.items():
+        op.execute('ALTER TABLE "show" ADD CONSTRAINT %s EXCLUDE USING gist '
+                   '(%s WITH =, %s WITH &&)' % (name, column, SHOW_DURING))
+
+
+def downgrade():
+    for name in EXCLUSION_CONSTRAINTS:
+        op.drop_constraint(name, 'show')
+    op.drop_constraint('ck_show_duration_minutes', 'show', type_='check')
+    op.drop_column('show', 'duration_minutes')
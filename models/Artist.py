@@ -1,4 +1,6 @@
+from datetime import datetime
 from utils.connection import db
+from utils.types import StringArray
 
 class Artist(db.Model):
     __tablename__ = 'artist'
@@ -11,8 +13,22 @@ class Artist(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False)
+    genres = db.Column(StringArray, nullable=False)
     seeking_venue = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String(120))
+    # maintained by utils/counters.py; upcoming/past are relative to the
+    # last counter roll-over rather than to the current time
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     shows = db.relationship('Show', backref='artist', lazy=True)
+
+    __table_args__ = (
+        # genre filters, genres @> ARRAY[...], on Postgres (see
+        # queries/facets.py); a plain index elsewhere
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        # state and city filters (see queries/facets.py)
+        db.Index('ix_artist_state_city', 'state', 'city'),
+    )
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
\ No newline at end of file
@@ -0,0 +1,30 @@
+from datetime import datetime
+from utils.connection import db
+
+# Background job queue (see utils/jobs.py). A job is queued, then running
+# while a worker holds it, then done or, after max_attempts, failed.
+class Job(db.Model):
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    idempotency_key = db.Column(db.String(255))
+    status = db.Column(db.String(16), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False, default=5, server_default='5')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # workers claim the oldest due jobs first
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        # at most one queued job per key, so repeated requests coalesce
+        db.Index('uq_job_queued_idempotency_key', 'idempotency_key', unique=True,
+                 postgresql_where=db.text("status = 'queued'"),
+                 sqlite_where=db.text("status = 'queued'")),
+    )
@@ -0,0 +1,22 @@
+from utils.connection import db
+
+# Precomputed artist-venue suggestions (see queries/matching.py). A row is
+# kept for a pair that is among the artist's best venues, the venue's best
+# artists, or both; artist_rank and venue_rank give its place in each list.
+class Match(db.Model):
+    __tablename__ = 'artist_venue_match'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'),
+                          primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'),
+                         primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    artist_rank = db.Column(db.Integer)
+    venue_rank = db.Column(db.Integer)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # the suggestion panels read one entity's list in rank order
+        db.Index('ix_artist_venue_match_artist_rank', 'artist_id', 'artist_rank'),
+        db.Index('ix_artist_venue_match_venue_rank', 'venue_id', 'venue_rank'),
+    )
@@ -1,5 +1,21 @@
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, event
 from utils.connection import db
 
+DEFAULT_DURATION_MINUTES = 120
+# bounds how far back a booking can reach into a later one (see
+# queries/scheduling.py)
+MAX_DURATION_MINUTES = 24 * 60
+
+# On Postgres, GiST exclusion constraints (with btree_gist for the integer
+# column) refuse overlapping bookings of a venue or an artist, even from
+# concurrent requests. A show occupies [start_time, start_time + duration).
+EXCLUSION_CONSTRAINTS = {
+    'ex_show_venue_id_during': 'venue_id',
+    'ex_show_artist_id_during': 'artist_id',
+}
+SHOW_DURING = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+
 # Association table that holds foreign keys for Venue and Artist models
 class Show(db.Model):
     __tablename__ = 'show'
@@ -8,4 +24,31 @@ class Show(db.Model):
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'artist.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+    start_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=DEFAULT_DURATION_MINUTES,
+                                 server_default=str(DEFAULT_DURATION_MINUTES))
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # keyset pagination of /shows orders by (start_time, id)
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        # a venue can't host two shows starting at the same time; the
+        # constraint's index also serves the per-venue show lookups
+        db.UniqueConstraint('venue_id', 'start_time', name='uq_show_venue_id_start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('duration_minutes BETWEEN 1 AND %d' % MAX_DURATION_MINUTES,
+                           name='ck_show_duration_minutes'),
+    )
+
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration_minutes)
+
+
+event.listen(Show.__table__, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+for _name, _column in EXCLUSION_CONSTRAINTS.items():
+    event.listen(Show.__table__, 'after_create', DDL(
+        'ALTER TABLE "show" ADD CONSTRAINT %s EXCLUDE USING gist (%s WITH =, %s WITH &&)'
+        % (_name, _column, SHOW_DURING)).execute_if(dialect='postgresql'))
@@ -0,0 +1,9 @@
+from utils.connection import db
+
+# Single row recording when the per-venue and per-artist show counters were
+# last rolled over; shows starting before as_of are counted as past.
+class ShowCounterWatermark(db.Model):
+    __tablename__ = 'show_counter_watermark'
+
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.DateTime, nullable=False)
@@ -1,4 +1,6 @@
+from datetime import datetime
 from utils.connection import db
+from utils.types import StringArray
 
 class Venue(db.Model):
     __tablename__ = 'venue'
@@ -12,8 +14,30 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False)
+    genres = db.Column(StringArray, nullable=False)
     seeking_talent = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String(120))
+    # set by `flask geocode` (see queries/geo.py); geohash indexes the
+    # location for proximity search
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # maintained by utils/counters.py; upcoming/past are relative to the
+    # last counter roll-over rather than to the current time
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     shows = db.relationship('Show', backref='venue', lazy=True)
+
+    __table_args__ = (
+        # proximity searches scan geohash ranges and filter on the
+        # coordinates without reading the table
+        db.Index('ix_venue_geohash', 'geohash', 'latitude', 'longitude'),
+        # genre filters, genres @> ARRAY[...], on Postgres (see
+        # queries/facets.py); a plain index elsewhere
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        # state and city filters (see queries/facets.py)
+        db.Index('ix_venue_state_city', 'state', 'city'),
+    )
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
\ No newline at end of file
@@ -0,0 +1,61 @@
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from models.Artist import Artist
+from models.Show import Show
+from queries.facets import filter_query
+from queries.matching import load_with_suggestions
+from utils.connection import db
+
+
+def get_artists(**filters):
+    # id and name of the artists matching filters (see queries/facets.py)
+    query = db.session.query(Artist.id, Artist.name)
+    rows = filter_query(query, Artist, **filters).order_by(Artist.id).all()
+    return [{"id": row.id, "name": row.name} for row in rows]
+
+
+def get_artist_detail(artist_id, now=None):
+    # Loads the artist with its suggested venues, then its shows and each
+    # show's venue, in two queries, and splits the shows into past and
+    # upcoming against a single `now`.
+    now = now or datetime.now()
+    loaded = load_with_suggestions(
+        'artist', artist_id, selectinload(Artist.shows).joinedload(Show.venue))
+    if loaded is None:
+        return None
+    artist, suggestions = loaded
+
+    data = dict()
+    data["id"] = artist.id
+    data["name"] = artist.name
+    data["genres"] = artist.genres
+    data["city"] = artist.city
+    data["state"] = artist.state
+    data["phone"] = artist.phone
+    data["facebook_link"] = artist.facebook_link
+    data["seeking_venue"] = artist.seeking_venue
+    data["image_link"] = artist.image_link
+
+    past_shows = []
+    upcoming_shows = []
+    for show in sorted(artist.shows, key=lambda show: show.start_time):
+        item = {
+            "id": show.id,
+            "updated_at": max(show.updated_at, show.venue.updated_at).isoformat(),
+            "venue_id": show.venue.id,
+            "venue_name": show.venue.name,
+            "venue_image_link": show.venue.image_link,
+            "start_time": show.start_time
+        }
+        if show.start_time < now:
+            past_shows.append(item)
+        else:
+            upcoming_shows.append(item)
+    past_shows.reverse()
+
+    data["past_shows"] = past_shows
+    data["upcoming_shows"] = upcoming_shows
+    data["past_shows_count"] = len(past_shows)
+    data["upcoming_shows_count"] = len(upcoming_shows)
+    data["suggested_venues"] = suggestions
+    return data
@@ -0,0 +1,140 @@
+#----------------------------------------------------------------------------#
+# Genre, city, state and seeking filters for venue and artist listings, and
+# facet counts under them.
+#
+# Genres are stored as an array per row (see utils/types.py). On Postgres the
+# genre filter is an array containment test, genres @> ARRAY[...], answered
+# from the GIN indexes on venue.genres and artist.genres (see migration
+# 6d0e9a2b4c71); on SQLite it looks the genres up in the row's JSON array
+# with json_each(). City and state filters use the (state, city) indexes.
+#
+# The counts for every facet come from a single statement that reads the
+# filtered rows once, as a CTE, and groups them once per facet, genres
+# unnested, with UNION ALL gluing the groupings together. The
+# callers cache them in the 'venues' and 'artists' response-cache namespaces,
+# which every change to a venue or artist already invalidates.
+#----------------------------------------------------------------------------#
+from sqlalchemy import and_, case, cast, exists, func, literal, null, select, true, union_all
+from models.Venue import Venue
+from models.Artist import Artist
+from utils.connection import db
+from utils.types import GENRES
+
+# query string arguments the filters are read from
+FILTER_ARGS = ('genre', 'city', 'state', 'seeking')
+SEEKING_COLUMNS = {Venue: 'seeking_talent', Artist: 'seeking_venue'}
+BOOLEANS = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def parse_facet_filters(args):
+    # filter_query and get_facets keyword arguments from a query string or
+    # form; raises ValueError for an unknown genre or seeking value
+    filters = dict()
+    genres = sorted(set(args.getlist('genre')))
+    for genre in genres:
+        if genre not in GENRES:
+            raise ValueError('Unknown genre: %s' % genre)
+    if genres:
+        filters["genres"] = genres
+    if args.get('city'):
+        filters["city"] = args['city']
+    if args.get('state'):
+        filters["state"] = args['state']
+    if args.get('seeking'):
+        if args['seeking'].lower() not in BOOLEANS:
+            raise ValueError('seeking must be true or false')
+        filters["seeking"] = BOOLEANS[args['seeking'].lower()]
+    return filters
+
+
+def _genre_values(column):
+    # the elements of a genres column, as a table with a value column, for
+    # joining laterally against the row it comes from
+    if db.engine.dialect.name == 'sqlite':
+        return func.json_each(column).table_valued('value')
+    return func.unnest(column).table_valued('value').render_derived()
+
+
+def _has_genres(model, genres):
+    if db.engine.dialect.name == 'sqlite':
+        conditions = []
+        for genre in genres:
+            values = _genre_values(model.genres)
+            conditions.append(exists(select(1).select_from(values).where(values.c.value == genre)))
+        return and_(*conditions)
+    # the generic ARRAY type has no @> of its own; the parameter is cast to
+    # the column's type, as varchar[] @> text[] has no operator
+    return model.genres.op('@>')(cast(genres, db.ARRAY(db.String(120))))
+
+
+def filter_query(query, model, genres=None, city=None, state=None, seeking=None):
+    # Narrows a query or select over model to the rows listing all of genres,
+    # in city and state, and seeking (talent or a venue) or not.
+    if genres:
+        query = query.filter(_has_genres(model, genres))
+    if city is not None:
+        query = query.filter(model.city == city)
+    if state is not None:
+        query = query.filter(model.state == state)
+    if seeking is not None:
+        query = query.filter(getattr(model, SEEKING_COLUMNS[model]) == seeking)
+    return query
+
+
+def get_facets(model, **filters):
+    # Counts of the rows matching filters per genre, (city, state), state and
+    # seeking flag, each list most common first.
+    seeking = getattr(model, SEEKING_COLUMNS[model])
+    rows = filter_query(select(
+        model.genres,
+        model.city,
+        model.state,
+        case((seeking, 'true'), else_='false').label('seeking')
+    ), model, **filters).cte('matches')
+    genres = _genre_values(rows.c.genres)
+
+    def facet(name, value, state, group_by, from_=rows):
+        return select(
+            literal(name).label('facet'),
+            value.label('value'),
+            state.label('state'),
+            func.count().label('count')
+        ).select_from(from_).group_by(*group_by)
+
+    statement = union_all(
+        facet('total', null(), null(), []),
+        facet('genre', genres.c.value, null(), [genres.c.value], rows.join(genres, true())),
+        facet('city', rows.c.city, rows.c.state, [rows.c.city, rows.c.state]),
+        facet('state', rows.c.state, null(), [rows.c.state]),
+        facet('seeking', rows.c.seeking, null(), [rows.c.seeking])
+    )
+
+    facets = {
+        "count": 0,
+        "genres": [],
+        "cities": [],
+        "states": [],
+        "seeking": {"true": 0, "false": 0}
+    }
+    for name, value, state, count in db.session.execute(statement):
+        if name == 'total':
+            facets["count"] = count
+        elif name == 'genre':
+            facets["genres"].append({"genre": value, "count": count})
+        elif name == 'city':
+            facets["cities"].append({"city": value, "state": state, "count": count})
+        elif name == 'state':
+            facets["states"].append({"state": value, "count": count})
+        else:
+            facets["seeking"][value] = count
+    for key, name in [('genres', 'genre'), ('cities', 'city'), ('states', 'state')]:
+        facets[key].sort(key=lambda item: (-item["count"], item[name]))
+    return facets
+
+
+def get_venue_facets(**filters):
+    return get_facets(Venue, **filters)
+
+
+def get_artist_facets(**filters):
+    return get_facets(Artist, **filters)
@@ -0,0 +1,230 @@
+#----------------------------------------------------------------------------#
+# Proximity search over venues.
+#
+# Venues carry latitude and longitude, set offline by `flask geocode`, and a
+# geohash of them. A geohash names a cell of a grid, and all points in a cell
+# share the cell's hash as a prefix. The geohash index can therefore be read
+# as a grid: a search around a point covers its bounding box with at most
+# MAX_CELLS cells, at the finest precision that allows, and reads each cell
+# as a range scan of the index. Candidates are then filtered and ordered
+# by an equirectangular distance computed in SQL. Its cos(latitude) factor is
+# fixed per query, so it is plain arithmetic on every database. Reported
+# distances are great-circle (haversine) kilometres.
+#
+# Nearest-k searches start at a small radius and widen it, by how many
+# venues are still missing, until k are found, so they read only the cells
+# near the point whatever the size of the table. Searches don't wrap around
+# the antimeridian.
+#----------------------------------------------------------------------------#
+import math
+from datetime import datetime
+from sqlalchemy import and_, event, inspect, or_
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from utils.connection import db
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# stored precision, ~5m cells
+GEOHASH_PRECISION = 9
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0088
+# most index ranges read per search
+MAX_CELLS = 16
+# nearest-k searches start at FIRST_RADIUS_KM and widen up to MAX_RADIUS_KM
+FIRST_RADIUS_KM = 2.0
+MAX_RADIUS_KM = 500.0
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# upcoming-show searches look at this many of the nearest venues
+SHOW_VENUES = 500
+LOCATION_FIELDS = ('address', 'city', 'state')
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) of a cell
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _bounding_box(latitude, longitude, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (max(latitude - dlat, -90.0), max(longitude - dlng, -180.0),
+            min(latitude + dlat, 90.0), min(longitude + dlng, 180.0))
+
+
+def covering_cells(latitude, longitude, radius_km):
+    # Geohash prefixes whose cells together cover the circle's bounding box,
+    # at the finest precision that needs at most MAX_CELLS of them.
+    south, west, north, east = _bounding_box(latitude, longitude, radius_km)
+
+    def steps(low, high, step):
+        values = []
+        value = low
+        while value < high:
+            values.append(value)
+            value += step
+        values.append(high)
+        return values
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lng = cell_size(precision)
+        if ((north - south) / cell_lat + 2) * ((east - west) / cell_lng + 2) > MAX_CELLS * 2:
+            # far too many cells, don't bother listing them
+            continue
+        cells = set(encode_geohash(lat, lng, precision)
+                    for lat in steps(south, north, cell_lat)
+                    for lng in steps(west, east, cell_lng))
+        if len(cells) <= MAX_CELLS or precision == 1:
+            return sorted(cells)
+    return sorted(BASE32)
+
+
+def _near(query, latitude, longitude, radius_km):
+    # Adds the cell ranges and the distance filter to a query over Venue;
+    # returns the query and the squared distance expression, in km^2.
+    cells = covering_cells(latitude, longitude, radius_km)
+    # '{' sorts right after 'z', the last geohash character
+    query = query.filter(or_(*[
+        and_(Venue.geohash >= cell, Venue.geohash < cell + '{') for cell in cells]))
+    kx = KM_PER_DEGREE * math.cos(math.radians(latitude))
+    ky = KM_PER_DEGREE
+    dy = (Venue.latitude - latitude) * ky
+    dx = (Venue.longitude - longitude) * kx
+    distance = dy * dy + dx * dx
+    return query.filter(distance <= radius_km * radius_km), distance
+
+
+def _venues_within(latitude, longitude, radius_km, limit, columns=None, with_upcoming_shows=False):
+    query = db.session.query(*(columns or [
+        Venue.id,
+        Venue.name,
+        Venue.address,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude
+    ]))
+    if with_upcoming_shows:
+        query = query.filter(Venue.upcoming_shows_count > 0)
+    query, distance = _near(query, latitude, longitude, radius_km)
+    return query.order_by(distance, Venue.id).limit(limit).all()
+
+
+def find_venues_near(latitude, longitude, radius_km=None, limit=DEFAULT_LIMIT):
+    # Venues within radius_km, nearest first, or the limit nearest venues
+    # within MAX_RADIUS_KM when no radius is given.
+    limit = min(max(limit or DEFAULT_LIMIT, 1), MAX_LIMIT)
+    if radius_km is not None:
+        rows = _venues_within(latitude, longitude, min(radius_km, MAX_RADIUS_KM), limit)
+    else:
+        radius_km = FIRST_RADIUS_KM
+        while True:
+            rows = _venues_within(latitude, longitude, radius_km, limit)
+            if len(rows) >= limit or radius_km >= MAX_RADIUS_KM:
+                break
+            # grow the area in proportion to the venues still missing
+            growth = math.sqrt(float(limit) / len(rows)) * 1.25 if rows else 4
+            radius_km = min(radius_km * growth, MAX_RADIUS_KM)
+
+    return [{
+        "id": row.id,
+        "name": row.name,
+        "address": row.address,
+        "city": row.city,
+        "state": row.state,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "distance_km": round(haversine_km(latitude, longitude, row.latitude, row.longitude), 3)
+    } for row in rows]
+
+
+def find_upcoming_shows_near(latitude, longitude, radius_km, limit=DEFAULT_LIMIT, now=None):
+    # The next upcoming shows at the SHOW_VENUES nearest venues with upcoming
+    # shows within radius_km, soonest first.
+    now = now or datetime.now()
+    limit = min(max(limit or DEFAULT_LIMIT, 1), MAX_LIMIT)
+    venues = dict((row.id, row) for row in _venues_within(
+        latitude, longitude, min(radius_km, MAX_RADIUS_KM), SHOW_VENUES,
+        columns=[Venue.id, Venue.name, Venue.latitude, Venue.longitude],
+        with_upcoming_shows=True))
+    if not venues:
+        return []
+    rows = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.duration_minutes,
+        Show.venue_id,
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Artist, Artist.id == Show.artist_id) \
+        .filter(Show.venue_id.in_(list(venues))) \
+        .filter(Show.start_time >= now) \
+        .order_by(Show.start_time, Show.id) \
+        .limit(limit) \
+        .all()
+
+    return [{
+        "id": row.id,
+        "start_time": row.start_time,
+        "duration_minutes": row.duration_minutes,
+        "venue_id": row.venue_id,
+        "venue_name": venues[row.venue_id].name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "distance_km": round(haversine_km(latitude, longitude, venues[row.venue_id].latitude,
+                                          venues[row.venue_id].longitude), 3)
+    } for row in rows]
+
+
+def set_location(target, latitude, longitude):
+    target.latitude = latitude
+    target.longitude = longitude
+    target.geohash = encode_geohash(latitude, longitude) if latitude is not None else None
+
+
+@event.listens_for(Venue, 'before_update')
+def _forget_moved_location(mapper, connection, target):
+    # A venue whose address changes is placed again by the next geocoding run.
+    state = inspect(target)
+    if state.attrs.latitude.history.has_changes():
+        return
+    if any(state.attrs[field].history.has_changes() for field in LOCATION_FIELDS):
+        set_location(target, None, None)
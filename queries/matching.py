@@ -0,0 +1,278 @@
+#----------------------------------------------------------------------------#
+# Artist-venue matchmaking.
+#
+# Artists seeking a venue are scored against venues seeking talent, over the
+# whole catalogue at once, with NumPy:
+#
+# - genre: cosine similarity of the two genre sets;
+# - history: how well each side's genres fit what the other has booked or
+#   played before. A venue's profile is the genre mix of the artists of its
+#   past shows, an artist's that of the venues it played;
+# - location: a bonus for the same city, and a smaller one for the same state.
+#
+# Every entity is a row of unit genre and profile vectors, so a block of
+# scores is a few matrix products and broadcast comparisons. Blocks of rows
+# are scored in turn to bound memory, and the best MATCHES_PER_ENTITY of each
+# row are picked with argpartition. The results replace the
+# artist_venue_match table in one transaction, in a background job (see
+# tasks.py) or `flask compute-matches`, so the suggestion panels of the
+# detail pages are an indexed lookup, joined to the statement that loads the
+# entity.
+#----------------------------------------------------------------------------#
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, func, select
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from models.Match import Match
+from utils.connection import db
+from utils.types import GENRES
+
+GENRE_WEIGHT = 0.5
+HISTORY_WEIGHT = 0.2
+CITY_WEIGHT = 0.2
+STATE_WEIGHT = 0.1
+# scores of at most this much are never suggested
+MIN_SCORE = 0.0
+# largest block of scores held in memory at once
+BLOCK_CELLS = 4 * 1024 * 1024
+INSERT_BATCH_SIZE = 5000
+GENRE_INDEX = dict((genre, i) for i, genre in enumerate(GENRES))
+# detail page key of each kind's suggestions
+SUGGESTED = {'artist': 'suggested_venues', 'venue': 'suggested_artists'}
+
+
+class Features(object):
+    # The ids of one side's entities and, row for row, their unit genre and
+    # history vectors and their city and state codes.
+
+    def __init__(self, ids, genres, history, cities, states):
+        self.ids = ids
+        self.genres = genres
+        self.history = history
+        self.cities = cities
+        self.states = states
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, start, stop):
+        return Features(self.ids[start:stop], self.genres[start:stop],
+                        self.history[start:stop], self.cities[start:stop],
+                        self.states[start:stop])
+
+
+def _genre_matrix(genre_lists):
+    matrix = np.zeros((len(genre_lists), len(GENRES)), dtype=np.float32)
+    for i, genres in enumerate(genre_lists):
+        for genre in genres or ():
+            if genre in GENRE_INDEX:
+                matrix[i, GENRE_INDEX[genre]] = 1
+    return matrix
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def _profiles(owners, others, counts, other_genres, size):
+    # Sum of the genre vectors of the entities each owner shared a show with,
+    # weighted by the number of shows; one bincount per genre.
+    profiles = np.zeros((size, other_genres.shape[1]), dtype=np.float32)
+    for genre in range(other_genres.shape[1]):
+        profiles[:, genre] = np.bincount(
+            owners, weights=counts * other_genres[others, genre], minlength=size)
+    return profiles
+
+
+def load_features(now=None):
+    # (artists seeking a venue, venues seeking talent) as Features
+    now = now or datetime.now()
+    artists = db.session.query(Artist.id, Artist.genres, Artist.city, Artist.state,
+                               Artist.seeking_venue.label('seeking')).order_by(Artist.id).all()
+    venues = db.session.query(Venue.id, Venue.genres, Venue.city, Venue.state,
+                              Venue.seeking_talent.label('seeking')).order_by(Venue.id).all()
+    artist_index = dict((row.id, i) for i, row in enumerate(artists))
+    venue_index = dict((row.id, i) for i, row in enumerate(venues))
+    artist_genres = _genre_matrix([row.genres for row in artists])
+    venue_genres = _genre_matrix([row.genres for row in venues])
+
+    pairs = db.session.query(Show.artist_id, Show.venue_id, func.count()) \
+        .filter(Show.start_time < now) \
+        .group_by(Show.artist_id, Show.venue_id) \
+        .all()
+    artist_rows = np.array([artist_index[pair[0]] for pair in pairs], dtype=np.int64)
+    venue_rows = np.array([venue_index[pair[1]] for pair in pairs], dtype=np.int64)
+    counts = np.array([pair[2] for pair in pairs], dtype=np.float32)
+    artist_history = _profiles(artist_rows, venue_rows, counts, venue_genres, len(artists))
+    venue_history = _profiles(venue_rows, artist_rows, counts, artist_genres, len(venues))
+
+    # cities and states compared by code, case and spacing aside
+    codes = dict()
+
+    def code(*parts):
+        return codes.setdefault(tuple(' '.join((part or '').lower().split()) for part in parts),
+                                len(codes))
+
+    def features(rows, genres, history):
+        picked = np.array([i for i, row in enumerate(rows) if row.seeking], dtype=np.int64)
+        return Features(
+            np.array([rows[i].id for i in picked], dtype=np.int64),
+            _normalise(genres[picked]),
+            _normalise(history[picked]),
+            np.array([code(rows[i].city, rows[i].state) for i in picked], dtype=np.int64),
+            np.array([code(rows[i].state) for i in picked], dtype=np.int64))
+
+    return (features(artists, artist_genres, artist_history),
+            features(venues, venue_genres, venue_history))
+
+
+def score(left, right):
+    # len(left) x len(right) matrix of match scores between 0 and 1; the
+    # same for either order of the two sides
+    scores = GENRE_WEIGHT * (left.genres @ right.genres.T)
+    scores += HISTORY_WEIGHT / 2 * (left.genres @ right.history.T + left.history @ right.genres.T)
+    scores += CITY_WEIGHT * (left.cities[:, None] == right.cities[None, :])
+    scores += STATE_WEIGHT * (left.states[:, None] == right.states[None, :])
+    return scores
+
+
+def top_matches(left, right, k):
+    # Yields (left id, right id, score, rank) for the k best scoring right
+    # entities of each left one, best first.
+    k = min(k, len(right))
+    if k == 0:
+        return
+    block_rows = max(1, BLOCK_CELLS // len(right))
+    for start in range(0, len(left), block_rows):
+        block = left.rows(start, start + block_rows)
+        scores = score(block, right)
+        if k < len(right):
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            # argpartition keeps any of the entities tied for the last place;
+            # keep those with the lowest ids, so that runs are repeatable
+            kth = np.take_along_axis(scores, best, axis=1).min(axis=1)
+            for i in np.flatnonzero((scores >= kth[:, None]).sum(axis=1) > k):
+                columns = np.flatnonzero(scores[i] >= kth[i])
+                best[i] = columns[np.lexsort((columns, -scores[i, columns]))[:k]]
+        else:
+            best = np.broadcast_to(np.arange(len(right)), scores.shape)
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        # by descending score, then ascending id
+        order = np.lexsort((best, -best_scores))
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for i, left_id in enumerate(block.ids.tolist()):
+            rank = 0
+            for column, value in zip(best[i].tolist(), best_scores[i].tolist()):
+                if value <= MIN_SCORE:
+                    break
+                rank += 1
+                yield left_id, int(right.ids[column]), value, rank
+
+
+def compute_matches(k=None, now=None):
+    # Replaces the artist_venue_match table with the k best venues of every
+    # artist seeking one and the k best artists of every venue seeking
+    # talent; returns the number of rows written.
+    k = k or current_app.config.get('MATCHES_PER_ENTITY', 10)
+    now = now or datetime.now()
+    artists, venues = load_features(now)
+    matches = dict()
+    for artist_id, venue_id, value, rank in top_matches(artists, venues, k):
+        matches[(artist_id, venue_id)] = {
+            "artist_id": artist_id,
+            "venue_id": venue_id,
+            "score": round(value, 6),
+            "artist_rank": rank,
+            "venue_rank": None,
+            "computed_at": now
+        }
+    for venue_id, artist_id, value, rank in top_matches(venues, artists, k):
+        match = matches.setdefault((artist_id, venue_id), {
+            "artist_id": artist_id,
+            "venue_id": venue_id,
+            "score": round(value, 6),
+            "artist_rank": None,
+            "computed_at": now
+        })
+        match["venue_rank"] = rank
+
+    table = Match.__table__
+    rows = list(matches.values())
+    db.session.execute(table.delete())
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
+
+
+def _suggestion_keys(kind):
+    # (counterpart, its seeking flag, own key, counterpart key, own rank)
+    if kind == 'artist':
+        return Venue, Venue.seeking_talent, Match.artist_id, Match.venue_id, Match.artist_rank
+    return Artist, Artist.seeking_venue, Match.venue_id, Match.artist_id, Match.venue_rank
+
+
+def _suggestion_columns(counterpart):
+    return [
+        counterpart.id.label('id'),
+        counterpart.name.label('name'),
+        counterpart.image_link.label('image_link'),
+        counterpart.city.label('city'),
+        counterpart.state.label('state'),
+        Match.score.label('score')
+    ]
+
+
+def suggestions_query(kind, entity_id):
+    # The best matches of an artist (venues) or a venue (artists) that are
+    # still seeking, best first, read through the rank index.
+    counterpart, seeking, own_key, counterpart_key, rank = _suggestion_keys(kind)
+    return select(*_suggestion_columns(counterpart)) \
+        .join(counterpart, counterpart.id == counterpart_key) \
+        .where(own_key == entity_id) \
+        .where(rank.isnot(None)) \
+        .where(seeking.is_(True)) \
+        .order_by(rank)
+
+
+def load_with_suggestions(kind, entity_id, *options):
+    # (entity, suggestions) of the artist or venue entity_id, loaded with
+    # options, in the same statement: the entity is outer joined to its
+    # matches, so its row comes back once per suggestion. None when there is
+    # no such entity.
+    model = Artist if kind == 'artist' else Venue
+    counterpart, seeking, own_key, counterpart_key, rank = _suggestion_keys(kind)
+    rows = db.session.query(model, *_suggestion_columns(counterpart)) \
+        .options(*options) \
+        .outerjoin(Match, and_(own_key == model.id, rank.isnot(None))) \
+        .outerjoin(counterpart, and_(counterpart.id == counterpart_key, seeking.is_(True))) \
+        .filter(model.id == entity_id) \
+        .order_by(rank) \
+        .all()
+    if not rows:
+        return None
+    return rows[0][0], suggestions_to_dicts(row for row in rows if row.id is not None)
+
+
+def suggestions_to_dicts(rows):
+    return [{
+        "id": row.id,
+        "name": row.name,
+        "image_link": row.image_link,
+        "city": row.city,
+        "state": row.state,
+        "score": row.score
+    } for row in rows]
+
+
+def get_suggested_venues(artist_id):
+    return suggestions_to_dicts(db.session.execute(suggestions_query('artist', artist_id)))
+
+
+def get_suggested_artists(venue_id):
+    return suggestions_to_dicts(db.session.execute(suggestions_query('venue', venue_id)))
@@ -0,0 +1,120 @@
+#----------------------------------------------------------------------------#
+# Booking conflicts and free slots.
+#
+# A show occupies [start_time, start_time + duration_minutes). Since no show
+# is longer than MAX_DURATION_MINUTES, the bookings that can touch a window
+# are found with a range scan of the (venue_id, start_time) or (artist_id,
+# start_time) index reaching that far back, on every database. They are
+# loaded into a Calendar, an in-memory interval index that answers overlap
+# and free-slot questions with binary searches and one sweep.
+#
+# On Postgres the exclusion constraints on show (see models/Show.py) also
+# reject overlapping bookings that race past the check here.
+#----------------------------------------------------------------------------#
+import itertools
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from sqlalchemy import bindparam, select
+from models.Show import Show, MAX_DURATION_MINUTES
+from utils.connection import db
+
+
+class Calendar(object):
+    # Bookings sorted by start, with the running maximum of their ends so
+    # that bookings overlapping each other (allowed on SQLite) are handled.
+
+    def __init__(self, bookings):
+        # bookings: (start, end, show_id) tuples
+        self.bookings = sorted(bookings)
+        self.starts = [booking[0] for booking in self.bookings]
+        self.max_ends = list(itertools.accumulate(
+            (booking[1] for booking in self.bookings), max))
+
+    def _window(self, start, end):
+        # index range of the bookings that may overlap [start, end)
+        return bisect_right(self.max_ends, start), bisect_left(self.starts, end)
+
+    def overlapping(self, start, end):
+        lo, hi = self._window(start, end)
+        return [booking for booking in self.bookings[lo:hi] if booking[1] > start]
+
+    def free(self, start, end, min_duration=timedelta(0)):
+        # gaps of at least min_duration between start and end
+        slots = []
+        cursor = start
+        lo, hi = self._window(start, end)
+        for booking_start, booking_end, _ in self.bookings[lo:hi]:
+            if booking_start > cursor:
+                slots.append((cursor, booking_start))
+            cursor = max(cursor, booking_end)
+        if cursor < end:
+            slots.append((cursor, end))
+        return [slot for slot in slots if slot[1] - slot[0] >= min_duration]
+
+
+def _bookings_query(column):
+    # built once; only the parameters change from call to call
+    return select(Show.start_time, Show.duration_minutes, Show.id) \
+        .where(column == bindparam('owner')) \
+        .where(Show.start_time < bindparam('end')) \
+        .where(Show.start_time > bindparam('reach')) \
+        .where(Show.id != bindparam('exclude_show_id'))
+
+
+_VENUE_BOOKINGS = _bookings_query(Show.venue_id)
+_ARTIST_BOOKINGS = _bookings_query(Show.artist_id)
+
+
+def _calendar(query, owner, start, end, exclude_show_id=None):
+    rows = db.session.execute(query, {
+        "owner": owner,
+        "end": end,
+        "reach": start - timedelta(minutes=MAX_DURATION_MINUTES),
+        "exclude_show_id": exclude_show_id or 0
+    })
+    minute = timedelta(minutes=1)
+    return Calendar((start_time, start_time + duration * minute, show_id)
+                    for start_time, duration, show_id in rows)
+
+
+def venue_calendar(venue_id, start, end, exclude_show_id=None):
+    return _calendar(_VENUE_BOOKINGS, venue_id, start, end, exclude_show_id)
+
+
+def artist_calendar(artist_id, start, end, exclude_show_id=None):
+    return _calendar(_ARTIST_BOOKINGS, artist_id, start, end, exclude_show_id)
+
+
+def load_calendars(column, owners, start, end):
+    # {owner: Calendar} of the bookings that may overlap [start, end) of
+    # every venue (column Show.venue_id) or artist (Show.artist_id) in
+    # owners, from one query; for checking many bookings at once
+    minute = timedelta(minutes=1)
+    bookings = dict((owner, []) for owner in owners)
+    rows = db.session.execute(
+        select(column, Show.start_time, Show.duration_minutes, Show.id)
+        .where(column.in_(list(bookings)))
+        .where(Show.start_time < end)
+        .where(Show.start_time > start - timedelta(minutes=MAX_DURATION_MINUTES)))
+    for owner, start_time, duration, show_id in rows:
+        bookings[owner].append((start_time, start_time + duration * minute, show_id))
+    return dict((owner, Calendar(items)) for owner, items in bookings.items())
+
+
+def find_conflicts(venue_id, artist_id, start_time, duration_minutes, exclude_show_id=None):
+    # Returns {"venue": [show ids], "artist": [show ids]} of the existing
+    # shows a booking would overlap; both lists are empty when it is free.
+    end_time = start_time + timedelta(minutes=duration_minutes)
+    return {
+        "venue": [booking[2] for booking in venue_calendar(
+            venue_id, start_time, end_time, exclude_show_id).overlapping(start_time, end_time)],
+        "artist": [booking[2] for booking in artist_calendar(
+            artist_id, start_time, end_time, exclude_show_id).overlapping(start_time, end_time)],
+    }
+
+
+def get_free_slots(venue_id, start, end, min_minutes=60):
+    # [(start, end)] of the venue's free periods of at least min_minutes
+    # between start and end
+    calendar = venue_calendar(venue_id, start, end)
+    return calendar.free(start, end, timedelta(minutes=min_minutes))
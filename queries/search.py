@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Venue and artist search.
+#
+# On Postgres the search runs against pg_trgm GIN indexes on name, city,
+# state and genres (see migration 3f1c2a7d9e04) and is ranked by trigram
+# word similarity, name matches first. On SQLite the same columns are mirrored
+# into an FTS5 table with the trigram tokenizer, kept in sync by triggers and
+# ranked with bm25(), so search can be exercised locally without Postgres.
+# Either way the matches can be narrowed by the filters of queries/facets.py.
+# An empty term lists every row (under the filters) by name, as the search
+# pages always have.
+#----------------------------------------------------------------------------#
+from sqlalchemy import DDL, column, event, func, or_, select, text
+from models.Venue import Venue
+from models.Artist import Artist
+from queries.facets import filter_query
+from utils.connection import db
+
+SEARCH_COLUMNS = ('name', 'city', 'state', 'genres')
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+# the trigram tokenizer can't MATCH terms shorter than a trigram
+MIN_MATCH_LENGTH = 3
+
+
+def _install_sqlite_index(table):
+    fts = '%s_search' % table.name
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join('new.%s' % column for column in SEARCH_COLUMNS)
+    old_values = ', '.join('old.%s' % column for column in SEARCH_COLUMNS)
+    insert_row = "INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new});"
+    delete_row = ("INSERT INTO {fts}({fts}, rowid, {columns}) "
+                  "VALUES ('delete', old.id, {old});")
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        "{columns}, content='{table}', content_rowid='id', tokenize='trigram')",
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        "CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        + insert_row + " END",
+        "CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        + delete_row + " END",
+        "CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        + delete_row + " " + insert_row + " END",
+    ]
+    for statement in statements:
+        ddl = DDL(statement.format(fts=fts, table=table.name, columns=columns,
+                                   new=new_values, old=old_values))
+        event.listen(table, 'after_create', ddl.execute_if(dialect='sqlite'))
+    event.listen(table, 'before_drop', DDL(
+        'DROP TABLE IF EXISTS %s' % fts).execute_if(dialect='sqlite'))
+
+
+_install_sqlite_index(Venue.__table__)
+_install_sqlite_index(Artist.__table__)
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_postgres(model, term, limit, offset, filters):
+    pattern = '%{}%'.format(_escape_like(term))
+    genres = func.fyyur_genres_text(model.genres)
+    match = or_(
+        model.name.ilike(pattern, escape='\\'),
+        model.city.ilike(pattern, escape='\\'),
+        model.state.ilike(pattern, escape='\\'),
+        genres.ilike(pattern, escape='\\')
+    )
+    rank = func.greatest(
+        func.word_similarity(term, model.name) * 2,
+        func.word_similarity(term, model.city),
+        func.word_similarity(term, model.state),
+        func.word_similarity(term, genres)
+    )
+    query = db.session.query(model.id, model.name, func.count().over()).filter(match)
+    return filter_query(query, model, **filters) \
+        .order_by(rank.desc(), model.name, model.id) \
+        .limit(limit) \
+        .offset(offset) \
+        .all()
+
+
+def _search_sqlite(model, term, limit, offset, filters):
+    fts = '%s_search' % model.__tablename__
+    params = dict()
+    if len(term) >= MIN_MATCH_LENGTH:
+        params["query"] = '"{}"'.format(term.replace('"', '""'))
+        where = '{fts} MATCH :query'
+        # weight name matches above city, state and genres
+        score = 'bm25({fts}, 10.0, 1.0, 1.0, 1.0)'
+    else:
+        params["pattern"] = '%{}%'.format(_escape_like(term))
+        where = ' OR '.join("%s LIKE :pattern ESCAPE '\\'" % column
+                            for column in SEARCH_COLUMNS)
+        score = '0'
+    # bm25() is only usable in a query directly against the FTS table
+    sql = 'SELECT rowid, ' + score + ' AS score FROM {fts} WHERE ' + where
+    matches = text(sql.format(fts=fts)).bindparams(**params) \
+        .columns(column('rowid'), column('score')) \
+        .subquery('m')
+    query = select(model.id, model.name, func.count().over()) \
+        .join(matches, model.id == matches.c.rowid)
+    query = filter_query(query, model, **filters) \
+        .order_by(matches.c.score, model.name, model.id) \
+        .limit(limit) \
+        .offset(offset)
+    return db.session.execute(query).fetchall()
+
+
+def _list_all(model, limit, offset, filters):
+    query = select(model.id, model.name, func.count().over())
+    query = filter_query(query, model, **filters) \
+        .order_by(model.name, model.id) \
+        .limit(limit) \
+        .offset(offset)
+    return db.session.execute(query).fetchall()
+
+
+def search(model, term, page=1, per_page=DEFAULT_PER_PAGE, **filters):
+    # Ranked, paginated search over name, city, state and genres, among the
+    # rows matching filters.
+    term = (term or '').strip()
+    page = max(page or 1, 1)
+    per_page = min(max(per_page or DEFAULT_PER_PAGE, 1), MAX_PER_PAGE)
+    results = {
+        "count": 0,
+        "data": [],
+        "page": page,
+        "per_page": per_page,
+        "has_next": False
+    }
+    offset = (page - 1) * per_page
+    if not term:
+        rows = _list_all(model, per_page, offset, filters)
+    elif db.engine.dialect.name == 'sqlite':
+        rows = _search_sqlite(model, term, per_page, offset, filters)
+    else:
+        rows = _search_postgres(model, term, per_page, offset, filters)
+
+    if rows:
+        results["count"] = rows[0][2]
+    elif page > 1:
+        # past the last page, the window count isn't available
+        results["count"] = search(model, term, 1, 1, **filters)["count"]
+    results["data"] = [{"id": row[0], "name": row[1]} for row in rows]
+    results["has_next"] = offset + len(rows) < results["count"]
+    return results
+
+
+def find_venues(term, page=1, per_page=DEFAULT_PER_PAGE, **filters):
+    return search(Venue, term, page, per_page, **filters)
+
+
+def find_artists(term, page=1, per_page=DEFAULT_PER_PAGE, **filters):
+    return search(Artist, term, page, per_page, **filters)
@@ -0,0 +1,143 @@
+import base64
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from utils.connection import db
+from utils.dates import parse_naive_datetime
+
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+
+def count_upcoming_shows(model, ids):
+    # Returns {id: number of upcoming shows} for every id in ids, where model
+    # is Venue or Artist, from the counters kept by utils/counters.py in a
+    # single query. Unknown ids are reported as 0.
+    counts = dict.fromkeys(ids, 0)
+    if not counts:
+        return counts
+    rows = db.session.query(model.id, model.upcoming_shows_count) \
+        .filter(model.id.in_(list(counts))) \
+        .all()
+    counts.update(rows)
+    return counts
+
+
+def count_upcoming_venue_shows(venue_ids):
+    return count_upcoming_shows(Venue, venue_ids)
+
+
+def count_upcoming_artist_shows(artist_ids):
+    return count_upcoming_shows(Artist, artist_ids)
+
+
+def encode_cursor(start_time, show_id):
+    value = '{}~{}'.format(start_time.isoformat(), show_id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # raises ValueError for a malformed cursor
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    start_time, show_id = value.split('~')
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+def parse_show_filters(args):
+    # get_shows_page keyword arguments from the /shows query string; raises
+    # ValueError (or OverflowError) for a malformed date
+    filters = dict()
+    filters["when"] = args.get('when') or None
+    filters["venue_id"] = args.get('venue_id', type=int)
+    filters["artist_id"] = args.get('artist_id', type=int)
+    filters["city"] = args.get('city') or None
+    if args.get('from'):
+        filters["start"] = parse_naive_datetime(args['from'])
+    if args.get('to'):
+        filters["end"] = parse_naive_datetime(args['to'])
+    return filters
+
+
+def shows_page_query(cursor=None, per_page=DEFAULT_PER_PAGE, when=None,
+                     start=None, end=None, venue_id=None, artist_id=None,
+                     city=None, now=None):
+    # The statement behind get_shows_page, also run by the async server
+    # (asgi.py); fetches one row more than a page to tell if there is a next.
+    now = now or datetime.now()
+    per_page = min(max(per_page or DEFAULT_PER_PAGE, 1), MAX_PER_PAGE)
+    query = select(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.updated_at,
+        Venue.updated_at.label('venue_updated_at'),
+        Artist.updated_at.label('artist_updated_at')
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id)
+
+    if when == 'upcoming':
+        query = query.where(Show.start_time >= now)
+    elif when == 'past':
+        query = query.where(Show.start_time < now)
+    if start is not None:
+        query = query.where(Show.start_time >= start)
+    if end is not None:
+        query = query.where(Show.start_time < end)
+    if venue_id is not None:
+        query = query.where(Show.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.where(Show.artist_id == artist_id)
+    if city:
+        query = query.where(Venue.city == city)
+
+    key = tuple_(Show.start_time, Show.id)
+    descending = when == 'past'
+    if cursor:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(key < after if descending else key > after)
+    if descending:
+        query = query.order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        query = query.order_by(Show.start_time, Show.id)
+
+    return query.limit(per_page + 1), per_page
+
+
+def shows_page_result(rows, per_page):
+    # Returns the page of shows and the cursor of the next page, or None on
+    # the last page.
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+
+    data = []
+    for row in rows:
+        data.append({
+            "id": row.id,
+            # the tile shows the show, its venue and its artist
+            "updated_at": max(row.updated_at, row.venue_updated_at, row.artist_updated_at).isoformat(),
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": row.start_time
+        })
+    return data, next_cursor
+
+
+def get_shows_page(cursor=None, per_page=DEFAULT_PER_PAGE, when=None,
+                   start=None, end=None, venue_id=None, artist_id=None,
+                   city=None, now=None):
+    # Keyset-paginated show listing ordered by (start_time, id), newest first
+    # when only past shows are requested.
+    query, per_page = shows_page_query(cursor, per_page, when, start, end,
+                                       venue_id, artist_id, city, now)
+    return shows_page_result(db.session.execute(query).all(), per_page)
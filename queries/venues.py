@@ -0,0 +1,91 @@
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from models.Venue import Venue
+from models.Show import Show
+from queries.facets import filter_query
+from queries.matching import load_with_suggestions
+from utils.connection import db
+
+
+def get_venue_areas(**filters):
+    # Returns the venues matching filters (see queries/facets.py) grouped by
+    # (city, state) together with their number of upcoming shows, read from
+    # the counters kept by utils/counters.py.
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    )
+    rows = filter_query(query, Venue, **filters) \
+        .order_by(Venue.state, Venue.city, Venue.name) \
+        .all()
+
+    areas = []
+    area_index = dict()
+    for row in rows:
+        key = (row.city, row.state)
+        if key not in area_index:
+            area_index[key] = len(areas)
+            areas.append({
+                "city": row.city,
+                "state": row.state,
+                "venues": []
+            })
+        areas[area_index[key]]["venues"].append({
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.num_upcoming_shows
+        })
+    return areas
+
+
+def get_venue_detail(venue_id, now=None):
+    # Loads the venue with its suggested artists, then its shows and each
+    # show's artist, in two queries, and splits the shows into past and
+    # upcoming against a single `now`.
+    now = now or datetime.now()
+    loaded = load_with_suggestions(
+        'venue', venue_id, selectinload(Venue.shows).joinedload(Show.artist))
+    if loaded is None:
+        return None
+    venue, suggestions = loaded
+
+    data = dict()
+    data["id"] = venue.id
+    data["name"] = venue.name
+    data["genres"] = venue.genres
+    data["address"] = venue.address
+    data["city"] = venue.city
+    data["state"] = venue.state
+    data["phone"] = venue.phone
+    data["website"] = venue.website
+    data["facebook_link"] = venue.facebook_link
+    data["seeking_talent"] = venue.seeking_talent
+    data["seeking_description"] = venue.seeking_description if venue.seeking_description is not None else ""
+    data["image_link"] = venue.image_link
+
+    past_shows = []
+    upcoming_shows = []
+    for show in sorted(venue.shows, key=lambda show: show.start_time):
+        item = {
+            "id": show.id,
+            "updated_at": max(show.updated_at, show.artist.updated_at).isoformat(),
+            "artist_id": show.artist.id,
+            "artist_name": show.artist.name,
+            "artist_image_link": show.artist.image_link,
+            "start_time": show.start_time
+        }
+        if show.start_time < now:
+            past_shows.append(item)
+        else:
+            upcoming_shows.append(item)
+    past_shows.reverse()
+
+    data["past_shows"] = past_shows
+    data["upcoming_shows"] = upcoming_shows
+    data["past_shows_count"] = len(past_shows)
+    data["upcoming_shows_count"] = len(upcoming_shows)
+    data["suggested_artists"] = suggestions
+    return data
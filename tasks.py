@@ -0,0 +1,44 @@
+#----------------------------------------------------------------------------#
+# Background tasks, run by the job queue (utils/jobs.py).
+#----------------------------------------------------------------------------#
+from models.Show import Show
+from queries.matching import compute_matches
+from utils.cache import cache
+from utils.connection import db
+from utils.counters import roll_over_show_counters
+from utils.jobs import task
+
+
+@task('refresh_venue_dependents')
+def refresh_venue_dependents(venue_id):
+    # the pages of artists who play the venue list its name and image
+    artist_ids = db.session.query(Show.artist_id) \
+        .filter(Show.venue_id == venue_id) \
+        .distinct()
+    for artist_id, in artist_ids:
+        cache.invalidate('artist', artist_id)
+
+
+@task('refresh_artist_dependents')
+def refresh_artist_dependents(artist_id):
+    # the pages of venues the artist plays list their name and image
+    venue_ids = db.session.query(Show.venue_id) \
+        .filter(Show.artist_id == artist_id) \
+        .distinct()
+    for venue_id, in venue_ids:
+        cache.invalidate('venue', venue_id)
+
+
+@task('compute_matches')
+def recompute_matches():
+    # the detail pages show the suggestions
+    compute_matches()
+    cache.invalidate('venue')
+    cache.invalidate('artist')
+
+
+@task('roll_over_show_counters', every='SHOW_COUNTERS_ROLLOVER_SECONDS')
+def roll_over_counters():
+    # the directory pages list the upcoming show counts
+    roll_over_show_counters()
+    cache.invalidate('venues')
@@ -0,0 +1,214 @@
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask build-assets` concatenates the files of each bundle in BUNDLES,
+# minifies them, and writes the result to ASSETS_DIR under a name carrying a
+# hash of its content (main.3f9c2a1b.css), next to .gz and, when the brotli
+# package is installed, .br copies. manifest.json maps bundle names to those
+# files, and templates link them with
+#
+#   {{ static_url('main.css') }}
+#
+# which falls back to the plain /static URL for anything not in a bundle.
+# Bundles are served from ASSETS_URL_PATH, precompressed when the client
+# accepts it, and cached by browsers for good: a changed bundle gets a new
+# name. The files of the previous build are kept so pages rendered before a
+# deploy still load.
+#----------------------------------------------------------------------------#
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# bundle name: files under the static folder, in order
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # loaded in <head>, before the page renders
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+MANIFEST = 'manifest.json'
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*!.*?\*/)|/\*.*?\*/|\s*;\s*(})\s*|\s*([{};,>])\s*|(\s+)''', re.S)
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+_manifest = dict()
+
+
+def minify_css(css):
+    # Drops comments (except /*! licences */), redundant whitespace and
+    # semicolons, leaving strings alone.
+    def token(match):
+        kept, brace, punctuation, space = match.groups()
+        if kept:
+            return kept
+        return brace or punctuation or (' ' if space else '')
+    return _CSS_TOKENS.sub(token, css).strip()
+
+
+def minify_js(js):
+    # Minified libraries are the bulk of every bundle; the app's own few
+    # lines are minified only when rjsmin is installed.
+    return rjsmin.jsmin(js) if rjsmin is not None else js
+
+
+def _rebase_urls(css, path, static_url_path):
+    # url()s are relative to the source file, not to the bundle
+    directory = os.path.dirname(path)
+
+    def rebase(match):
+        quote, target = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', target):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(directory, target)).replace(os.sep, '/')
+        return 'url(%s%s/%s%s)' % (quote, static_url_path, target, quote)
+    return _CSS_URL.sub(rebase, css)
+
+
+def bundle(static_folder, name, static_url_path='/static'):
+    contents = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+            content = f.read()
+        if name.endswith('.css'):
+            contents.append(minify_css(_rebase_urls(content, path, static_url_path)))
+        elif path.endswith('.min.js'):
+            contents.append(content.strip())
+        else:
+            contents.append(minify_js(content).strip())
+    if name.endswith('.js'):
+        # a file may end without a semicolon
+        return ';\n'.join(contents).encode('utf-8')
+    return '\n'.join(contents).encode('utf-8')
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def build(static_folder, output_dir, static_url_path='/static'):
+    # Writes every bundle, its precompressed copies and the manifest, and
+    # returns the manifest.
+    os.makedirs(output_dir, exist_ok=True)
+    previous = _read_manifest(output_dir)
+    manifest = dict()
+    for name in sorted(BUNDLES):
+        data = bundle(static_folder, name, static_url_path)
+        stem, extension = os.path.splitext(name)
+        filename = '%s.%s%s' % (stem, hashlib.sha256(data).hexdigest()[:12], extension)
+        path = os.path.join(output_dir, filename)
+        if not os.path.exists(path):
+            _write(path, data)
+            # mtime=0 keeps the .gz identical from build to build
+            _write(path + '.gz', gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                _write(path + '.br', brotli.compress(data))
+        manifest[name] = filename
+
+    keep = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(output_dir):
+        base = filename
+        for _, suffix in ENCODINGS:
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if filename != MANIFEST and base not in keep:
+            os.remove(os.path.join(output_dir, filename))
+
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _stale(static_folder, output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return True
+    built = os.path.getmtime(path)
+    return any(os.path.getmtime(os.path.join(static_folder, source)) > built
+               for sources in BUNDLES.values() for source in sources)
+
+
+def build_app_assets(app):
+    manifest = build(app.static_folder, app.config['ASSETS_DIR'], app.static_url_path)
+    _manifest.clear()
+    _manifest.update(manifest)
+    return manifest
+
+
+def static_url(name):
+    filename = _manifest.get(name)
+    if filename is None:
+        return url_for('static', filename=name)
+    return url_for('assets', filename=filename)
+
+
+def serve_asset(filename):
+    output_dir = current_app.config['ASSETS_DIR']
+    path = safe_join(output_dir, filename)
+    if path is None or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding = name
+            path += suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % \
+        current_app.config.get('ASSETS_MAX_AGE', 31536000)
+    return response
+
+
+def init_assets(app):
+    app.config.setdefault('ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+    output_dir = app.config['ASSETS_DIR']
+    if app.config.get('ASSETS_AUTO_BUILD', True) and (
+            app.debug or not os.path.exists(os.path.join(output_dir, MANIFEST))) \
+            and _stale(app.static_folder, output_dir):
+        build_app_assets(app)
+    else:
+        _manifest.update(_read_manifest(output_dir))
+    app.add_url_rule(app.config.get('ASSETS_URL_PATH', '/assets') + '/<path:filename>',
+                     'assets', serve_asset)
+    app.jinja_env.globals['static_url'] = static_url
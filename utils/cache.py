@@ -0,0 +1,235 @@
+#----------------------------------------------------------------------------#
+# Read-through response cache.
+#
+# Rendered pages are stored per namespace (a route, e.g. 'venues' or 'venue')
+# and entity id. Every namespace, and every entity invalidated on its own, has
+# a generation number that is part of the key, so either can be invalidated
+# by bumping it; entries of old generations are never read again and age out
+# of the backend on their own.
+#
+# A page's key is computed once, before it is looked up, and the rendered
+# page is stored under that same key. A render overtaken by an invalidation
+# (say, one that read a lagging replica) is thus stored under the old
+# generation, where it is never read, rather than served as the new one.
+#
+# Backends:
+#   'simple'    in-process LRU with TTL and a size bound (default)
+#   'redis'     shared Redis server at CACHE_REDIS_URL (needs the redis
+#               package, see requirements-optional.txt)
+#   'fakeredis' in-process stand-in for Redis, for tests
+#   'null'      caching disabled
+#----------------------------------------------------------------------------#
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, session
+
+
+class NullBackend(object):
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key):
+        return 0
+
+
+class LRUBackend(object):
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # counters (generations: one per namespace, and one per entity
+        # invalidated on its own) live outside the LRU so they are never evicted
+        self._counters = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(object):
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class FakeRedis(object):
+    # implements the subset of the redis-py client used by RedisBackend
+    def __init__(self):
+        self._data = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (b'0', None))
+            value = int(value) + 1
+            self._data[key] = (str(value).encode('utf-8'), expires)
+            return value
+
+
+class ResponseCache(object):
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.default_ttl = 60
+        self._lock = threading.Lock()
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'simple')
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+        if cache_type == 'simple':
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif cache_type == 'redis':
+            import redis
+            client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.backend = RedisBackend(client)
+        elif cache_type == 'fakeredis':
+            self.backend = RedisBackend(FakeRedis())
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError('Unknown CACHE_TYPE: %s' % cache_type)
+        app.extensions['response_cache'] = self
+
+    def key(self, namespace, ident):
+        # the key of ident's entry in namespace, as of the generations now
+        generation = self.backend.get('gen:' + namespace) or 0
+        entity_generation = self.backend.get('gen:%s:%s' % (namespace, ident)) or 0
+        return '%s:%s:%s:%s' % (namespace, generation, ident, entity_generation)
+
+    def get_key(self, namespace, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self._misses[namespace] += 1
+            else:
+                self._hits[namespace] += 1
+        return value
+
+    def set_key(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl or self.default_ttl)
+
+    def invalidate(self, namespace, ident=None):
+        # drops one entity's entry, or the whole namespace when ident is None
+        if ident is None:
+            self.backend.incr('gen:' + namespace)
+        else:
+            self.backend.incr('gen:%s:%s' % (namespace, ident))
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self._hits) | set(self._misses)
+            return {
+                namespace: {
+                    "hits": self._hits[namespace],
+                    "misses": self._misses[namespace]
+                } for namespace in sorted(namespaces)
+            }
+
+    def cached(self, namespace, key=None, ttl=None, vary=()):
+        # Caches the rendered body of a GET view under namespace, per value of
+        # the view argument named key and of the query string arguments named
+        # in vary. Responses carrying flashed messages, or rendered with a
+        # visitor's own locale or timezone, are neither served from nor stored
+        # in the cache.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or session.get('_flashes') \
+                        or session.get('preferences'):
+                    return view(*args, **kwargs)
+                entry = self.key(namespace, request_ident(kwargs[key] if key else 'all', vary))
+                body = self.get_key(namespace, entry)
+                if body is not None:
+                    return body
+                rv = view(*args, **kwargs)
+                if isinstance(rv, str):
+                    self.set_key(entry, rv, ttl)
+                return rv
+            return wrapper
+        return decorator
+
+
+def request_ident(ident, vary):
+    # ident, followed by the values of the request's query string arguments
+    # named in vary in a canonical order, when it has any
+    args = sorted((name, value) for name in vary
+                  for value in request.args.getlist(name) if value)
+    return '%s?%s' % (ident, urlencode(args)) if args else ident
+
+
+cache = ResponseCache()
@@ -1,3 +1,249 @@
+import itertools
+import threading
+import time
+from flask import current_app, request, session as user_session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, orm, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, TimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+try:
+    # Flask-SQLAlchemy 2.x
+    from flask_sqlalchemy import SignallingSession as _BaseSession
+    _LEGACY_SESSION = True
+except ImportError:
+    from flask_sqlalchemy.session import Session as _BaseSession
+    _LEGACY_SESSION = False
 
-db = SQLAlchemy()
\ No newline at end of file
+# pool metrics per pool_logging_name
+pool_metrics = dict()
+_pool_metrics_lock = threading.Lock()
+
+
+class PoolMetrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pool = None
+        self.checkouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.closes = 0
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_close(self):
+        with self._lock:
+            self.closes += 1
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "checkout_wait_ms_avg": 1000 * self.checkout_seconds_total / self.checkouts
+                if self.checkouts else 0.0,
+                "checkout_wait_ms_max": 1000 * self.checkout_seconds_max,
+                "checkout_timeouts": self.timeouts,
+                "connections_opened": self.connects,
+                "connections_closed": self.closes
+            }
+        pool = self.pool
+        if pool is not None:
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            data["pool_size"] = pool.size()
+            data["checked_out"] = pool.checkedout()
+            data["overflow"] = max(pool.overflow(), 0)
+            data["saturation"] = pool.checkedout() / capacity if capacity else 0.0
+        return data
+
+
+def get_pool_metrics(name):
+    with _pool_metrics_lock:
+        if name not in pool_metrics:
+            pool_metrics[name] = PoolMetrics()
+        return pool_metrics[name]
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that records how long checkouts wait and how often physical
+    # connections are opened and closed, under its pool_logging_name.
+
+    @property
+    def metrics(self):
+        metrics = get_pool_metrics(self.logging_name or 'default')
+        metrics.pool = self
+        return metrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def _create_connection(self):
+        self.metrics.record_connect()
+        return super(InstrumentedQueuePool, self)._create_connection()
+
+    def _close_connection(self, connection, *args, **kwargs):
+        self.metrics.record_close()
+        return super(InstrumentedQueuePool, self)._close_connection(connection, *args, **kwargs)
+
+
+def engine_options(config, name='primary', uri=None):
+    # SQLAlchemy engine options for a database URI from the DATABASE_* settings
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite'):
+        # SQLite gets SQLAlchemy's default single-file pooling
+        return dict()
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": config.get('DATABASE_POOL_SIZE', 5),
+        "max_overflow": config.get('DATABASE_MAX_OVERFLOW', 10),
+        "pool_timeout": config.get('DATABASE_POOL_TIMEOUT', 30),
+        "pool_recycle": config.get('DATABASE_POOL_RECYCLE', 1800),
+        "pool_pre_ping": config.get('DATABASE_POOL_PRE_PING', True),
+        "connect_args": dict()
+    }
+    statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+    if config.get('DATABASE_PGBOUNCER'):
+        # PgBouncer rejects startup options, so the timeout is set per
+        # transaction instead (see init_db); psycopg 3 must not prepare
+        if uri.startswith('postgresql+psycopg:'):
+            options["connect_args"]["prepare_threshold"] = None
+    elif statement_timeout and uri.startswith('postgres'):
+        options["connect_args"]["options"] = '-c statement_timeout=%d' % statement_timeout
+    return options
+
+
+def _set_local_statement_timeout(timeout):
+    def begin(connection):
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET LOCAL statement_timeout = %d' % timeout)
+    return begin
+
+
+class ReplicaSet(object):
+    # Round-robin over the read replicas that passed their last health check.
+    # A replica is pinged at most once per health_check_interval seconds when
+    # it comes up in the rotation; one that fails stays out until the next
+    # check.
+
+    def __init__(self, engines, health_check_interval=10):
+        self.engines = engines
+        self.health_check_interval = health_check_interval
+        self._healthy = dict((engine, True) for engine in engines)
+        self._checked_at = dict((engine, time.monotonic()) for engine in engines)
+        self._next = itertools.cycle(engines)
+        self._lock = threading.Lock()
+
+    def is_healthy(self, engine):
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._checked_at[engine] >= self.health_check_interval
+            if due:
+                self._checked_at[engine] = now
+        if due:
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                self._healthy[engine] = True
+            except DBAPIError:
+                self._healthy[engine] = False
+        return self._healthy[engine]
+
+    def choose(self):
+        # returns a healthy replica engine, or None to fall back to the primary
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._next)
+            if self.is_healthy(engine):
+                return engine
+        return None
+
+
+class RoutingSession(_BaseSession):
+    # Sends the reads of read-only requests to a replica; flushes, writes and
+    # everything outside such a request go to the primary.
+
+    def get_bind(self, mapper=None, clause=None, *args, **kwargs):
+        if self.info.get('use_replica') and not self._flushing \
+                and not isinstance(clause, UpdateBase):
+            replicas = current_app.extensions.get('replicas')
+            engine = replicas.choose() if replicas else None
+            if engine is not None:
+                return engine
+        return super(RoutingSession, self).get_bind(mapper, clause, *args, **kwargs)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        # Flask-SQLAlchemy 2.x; 3.x takes the class from session_options
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy(
+    session_options={} if _LEGACY_SESSION else {'class_': RoutingSession})
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+def _route_reads():
+    # GET and HEAD requests read from a replica, unless this user wrote
+    # something recently and might not see it there yet
+    primary_until = user_session.get('_primary_until', 0)
+    db.session.info['use_replica'] = request.method in ('GET', 'HEAD') \
+        and primary_until < time.time()
+
+
+def _pin_after_write(response):
+    if db.session.info.pop('wrote', False):
+        user_session['_primary_until'] = time.time() + \
+            current_app.config.get('READ_AFTER_WRITE_SECONDS', 5)
+    return response
+
+
+def init_replicas(app):
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    if not uris:
+        return
+    engines = [
+        create_engine(uri, **engine_options(app.config, 'replica-%d' % i, uri))
+        for i, uri in enumerate(uris, start=1)
+    ]
+    app.extensions['replicas'] = ReplicaSet(
+        engines, app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 10))
+    app.before_request(_route_reads)
+    app.after_request(_pin_after_write)
+
+
+def init_db(app):
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    statement_timeout = app.config.get('DATABASE_STATEMENT_TIMEOUT_MS')
+    if app.config.get('DATABASE_PGBOUNCER') and statement_timeout:
+        event.listen(Engine, 'begin', _set_local_statement_timeout(statement_timeout))
+    db.init_app(app)
+    init_replicas(app)
@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Per-venue and per-artist show counters.
+#
+# Venue and Artist carry upcoming_shows_count and past_shows_count so list
+# pages can read them instead of scanning the show table. A show counts as
+# past once it starts before the watermark in show_counter_watermark:
+#
+# - ORM inserts, updates and deletes of shows adjust the counters of the
+#   affected venue and artist in the same transaction;
+# - roll_over_show_counters(), run as a recurring job (see tasks.py) or by
+#   `flask rollover-shows`, moves the shows that started since the last
+#   roll-over from upcoming to past and advances the watermark;
+# - recompute_show_counters() (`flask rollover-shows --full`) rebuilds every
+#   counter, for use after writes that bypass the ORM such as bulk imports.
+#
+# Counter updates leave updated_at as it is: it dates changes to the venue or
+# artist itself, which incremental exports, ETags and fragment keys rely on.
+#----------------------------------------------------------------------------#
+from datetime import datetime
+from sqlalchemy import and_, event, func, inspect, select
+from models.Venue import Venue
+from models.Artist import Artist
+from models.Show import Show
+from models.ShowCounterWatermark import ShowCounterWatermark
+from utils.connection import db
+
+# before the first roll-over every show counts as upcoming
+EPOCH = datetime(1970, 1, 1)
+WATERMARK_ID = 1
+COUNTED = (
+    (Venue, Show.venue_id, 'venue_id'),
+    (Artist, Show.artist_id, 'artist_id'),
+)
+
+
+def _watermark(connection, for_update=False, read=False):
+    table = ShowCounterWatermark.__table__
+    query = select(table.c.as_of).where(table.c.id == WATERMARK_ID)
+    if for_update:
+        query = query.with_for_update(read=read)
+    as_of = connection.execute(query).scalar()
+    return as_of if as_of is not None else EPOCH
+
+
+def _adjust(connection, model, entity_id, start_time, as_of, delta):
+    table = model.__table__
+    column = table.c.upcoming_shows_count if start_time >= as_of else table.c.past_shows_count
+    connection.execute(table.update()
+                       .where(table.c.id == entity_id)
+                       .values({column.name: column + delta,
+                                table.c.updated_at.name: table.c.updated_at}))
+
+
+def _adjust_all(connection, values, delta):
+    # takes a share lock on the watermark so a concurrent roll-over can't
+    # move it between reading it and applying the adjustment
+    as_of = _watermark(connection, for_update=True, read=True)
+    for model, _, attribute in COUNTED:
+        _adjust(connection, model, values[attribute], values['start_time'], as_of, delta)
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, show):
+    _adjust_all(connection, dict(
+        (name, getattr(show, name)) for name in ('venue_id', 'artist_id', 'start_time')), 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, show):
+    _adjust_all(connection, dict(
+        (name, getattr(show, name)) for name in ('venue_id', 'artist_id', 'start_time')), -1)
+
+
+def _keep_old_value(show, value, oldvalue, initiator):
+    return value
+
+
+# make the ORM load the previous value when one of these is reassigned on an
+# expired show, so after_update can see what the show was counted under
+for _attribute in (Show.venue_id, Show.artist_id, Show.start_time):
+    event.listen(_attribute, 'set', _keep_old_value, active_history=True, retval=True)
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, show):
+    state = inspect(show)
+    old = dict()
+    new = dict()
+    changed = False
+    for name in ('venue_id', 'artist_id', 'start_time'):
+        history = state.attrs[name].history
+        new[name] = getattr(show, name)
+        old[name] = history.deleted[0] if history.deleted else new[name]
+        changed = changed or old[name] != new[name]
+    if changed:
+        _adjust_all(connection, old, -1)
+        _adjust_all(connection, new, 1)
+
+
+def _set_watermark(as_of):
+    watermark = db.session.get(ShowCounterWatermark, WATERMARK_ID)
+    if watermark is None:
+        db.session.add(ShowCounterWatermark(id=WATERMARK_ID, as_of=as_of))
+    else:
+        watermark.as_of = as_of
+
+
+def roll_over_show_counters(now=None):
+    # Moves shows that started since the last roll-over from the upcoming to
+    # the past counters. Only venues and artists with such shows are updated.
+    now = now or datetime.now()
+    as_of = _watermark(db.session.connection(), for_update=True)
+    if now <= as_of:
+        db.session.rollback()
+        return
+    window = and_(Show.start_time >= as_of, Show.start_time < now)
+    for model, key, _ in COUNTED:
+        moved = select(func.count(Show.id)).where(key == model.id, window).scalar_subquery()
+        db.session.query(model) \
+            .filter(model.id.in_(select(key).where(window))) \
+            .update({
+                model.upcoming_shows_count: model.upcoming_shows_count - moved,
+                model.past_shows_count: model.past_shows_count + moved,
+                model.updated_at: model.updated_at
+            }, synchronize_session=False)
+    _set_watermark(now)
+    db.session.commit()
+
+
+def recompute_show_counters(now=None):
+    # Rebuilds every counter from the show table.
+    now = now or datetime.now()
+    _watermark(db.session.connection(), for_update=True)
+    for model, key, _ in COUNTED:
+        def count(condition):
+            return select(func.count(Show.id)).where(key == model.id, condition).scalar_subquery()
+        db.session.query(model).update({
+            model.upcoming_shows_count: count(Show.start_time >= now),
+            model.past_shows_count: count(Show.start_time < now),
+            model.updated_at: model.updated_at
+        }, synchronize_session=False)
+    _set_watermark(now)
+    db.session.commit()
@@ -0,0 +1,121 @@
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#
+# The `datetime` Jinja filter takes datetime objects (ISO strings still work)
+# and formats them with babel patterns compiled once per format string, in
+# the locale and timezone the visitor picked (see set_preferences), or the
+# configured defaults. Results are memoised in a bounded LRU, so pages that
+# show the same times over and over (list pages, repeated renders) format
+# each one once.
+#
+# Stored times are naive, in the server's local time like datetime.now().
+# They are shown as they are unless a timezone is chosen, by the visitor or
+# with DEFAULT_TIMEZONE, in which case they are read as
+# DATETIME_SOURCE_TIMEZONE (by default the server's zone) and converted.
+# parse_naive_datetime goes the other way, for times read from query strings.
+#----------------------------------------------------------------------------#
+from datetime import datetime
+from functools import lru_cache
+import dateutil.parser
+from babel import Locale, UnknownLocaleError
+from babel.dates import get_timezone, parse_pattern
+from flask import current_app, g, has_request_context, session
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+# formatted values kept, across all formats, locales and timezones
+MEMO_SIZE = 65536
+
+
+@lru_cache(maxsize=None)
+def _pattern(format):
+    return parse_pattern(FORMATS.get(format, format))
+
+
+@lru_cache(maxsize=None)
+def _locale(name):
+    return Locale.parse(name)
+
+
+@lru_cache(maxsize=None)
+def _timezone(name):
+    # None is the server's local zone
+    return get_timezone(name)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _format(value, format, locale, timezone, source_timezone):
+    if timezone is not None:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=_timezone(source_timezone))
+        value = value.astimezone(_timezone(timezone))
+    return _pattern(format).apply(value, _locale(locale))
+
+
+def _parse(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+def parse_naive_datetime(value):
+    # A query string time as stored: one with a timezone is converted to
+    # DATETIME_SOURCE_TIMEZONE and made naive, so it compares with stored
+    # times. Raises ValueError (or OverflowError) for a malformed one.
+    value = dateutil.parser.parse(value)
+    if value.tzinfo is not None:
+        source_timezone = current_app.config.get('DATETIME_SOURCE_TIMEZONE')
+        value = value.astimezone(_timezone(source_timezone)).replace(tzinfo=None)
+    return value
+
+
+def get_preferences():
+    # (locale, timezone) for the current request; timezone None means as stored
+    preferences = g.get('date_preferences') if has_request_context() else None
+    if preferences is None:
+        chosen = (session.get('preferences') or {}) if has_request_context() else {}
+        preferences = (chosen.get('locale') or current_app.config.get('DEFAULT_LOCALE', 'en'),
+                       chosen.get('timezone') or current_app.config.get('DEFAULT_TIMEZONE'))
+        if has_request_context():
+            g.date_preferences = preferences
+    return preferences
+
+
+def set_preferences(locale=None, timezone=None):
+    # Validates and stores the visitor's choices in their session; raises
+    # ValueError for an unsupported locale or unknown timezone.
+    if locale:
+        if locale not in current_app.config.get('SUPPORTED_LOCALES', ['en']):
+            raise ValueError('Unsupported locale: %s' % locale)
+        try:
+            _locale(locale)
+        except (UnknownLocaleError, ValueError):
+            raise ValueError('Unknown locale: %s' % locale)
+    if timezone:
+        try:
+            _timezone(timezone)
+        except LookupError:
+            raise ValueError('Unknown timezone: %s' % timezone)
+    preferences = dict((key, value) for key, value in
+                       (('locale', locale), ('timezone', timezone)) if value)
+    if preferences:
+        session['preferences'] = preferences
+    else:
+        session.pop('preferences', None)
+    g.pop('date_preferences', None)
+
+
+def format_datetime(value, format='medium', locale=None, timezone=None):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, str):
+        value = _parse(value)
+    if locale is None or timezone is None:
+        preferred_locale, preferred_timezone = get_preferences()
+        locale = locale or preferred_locale
+        timezone = timezone or preferred_timezone
+    return _format(value, format, locale, timezone,
+                   current_app.config.get('DATETIME_SOURCE_TIMEZONE'))
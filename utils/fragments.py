@@ -0,0 +1,59 @@
+#----------------------------------------------------------------------------#
+# Template fragment cache.
+#
+#   {% cache 'venue_show', show.id, show.updated_at %} ... {% endcache %}
+#
+# stores the rendered block under the namespace given first, keyed by the
+# remaining arguments. Passing the entity's updated_at makes the key change
+# whenever the entity does, so entries never need to be deleted; stale ones
+# are simply not read again and fall out of the LRU. That also makes a cache
+# per process safe, so fragments stay in process memory whatever CACHE_TYPE
+# is, and reading one costs no network round trip. To drop a whole
+# namespace (e.g. after changing how a tile renders), call
+# fragments.invalidate(namespace), which bumps its generation.
+#----------------------------------------------------------------------------#
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from utils.cache import LRUBackend, ResponseCache
+from utils.dates import get_preferences
+
+fragments = ResponseCache()
+
+
+class FragmentCacheExtension(Extension):
+    tags = set(['cache'])
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache_enabled=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, args, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+        namespace = args[0]
+        # tiles show dates in the visitor's locale and timezone
+        ident = ':'.join(str(arg) for arg in args[1:] + list(get_preferences()))
+        key = fragments.key(namespace, ident)
+        body = fragments.get_key(namespace, key)
+        if body is None:
+            body = caller()
+            fragments.set_key(key, body)
+        return Markup(body)
+
+
+def init_fragments(app):
+    fragments.default_ttl = app.config.get('FRAGMENT_CACHE_TTL', 3600)
+    fragments.backend = LRUBackend(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000))
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
+    app.extensions['fragment_cache'] = fragments
@@ -0,0 +1,210 @@
+#----------------------------------------------------------------------------#
+# Background jobs, queued in the job table.
+#
+# enqueue() adds a job to the current transaction. It is committed with the
+# write that needs it, and never exists if that write rolls back. Workers
+# claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so any
+# number of them can share the table. On SQLite each claim is a
+# compare-and-set on the status. A job that raises is retried with
+# exponential backoff until it has run max_attempts times. A job whose worker
+# died is retried once its lease expires.
+#
+# Delivery is at least once, so tasks must be idempotent. A job with an
+# idempotency key is not queued while a job with the same key is still
+# waiting; bursts of identical follow-up work coalesce into one run.
+#
+# Jobs run in `flask worker`, or in JOBS_WORKER_THREADS threads of the web
+# process itself. Tasks that touch an in-process cache need the latter.
+#
+# A recurring task is queued when a worker starts and, after each run,
+# queued again to run once its interval has passed. Its name is its
+# idempotency key, so however many workers there are it has one queued job.
+#----------------------------------------------------------------------------#
+import random
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from models.Job import Job
+from utils.connection import db
+
+tasks = dict()
+# task name -> config key of its interval in seconds
+recurring = dict()
+
+
+def task(name, every=None):
+    # Registers a function(**payload) as the handler of jobs named name;
+    # every names the config key of the interval of a recurring task.
+    def decorator(handler):
+        tasks[name] = handler
+        if every is not None:
+            recurring[name] = every
+        return handler
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    # Queue a job in the current transaction; the caller commits.
+    values = {
+        "task": name,
+        "payload": payload or {},
+        "idempotency_key": key,
+        "status": 'queued',
+        "attempts": 0,
+        "max_attempts": max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', 5),
+        "run_at": datetime.utcnow() + timedelta(seconds=delay),
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+    dialect = db.session.get_bind().dialect.name
+    if key is None or dialect not in ('postgresql', 'sqlite'):
+        db.session.add(Job(**values))
+        return
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    db.session.execute(insert(Job.__table__).values(**values).on_conflict_do_nothing(
+        index_elements=['idempotency_key'],
+        index_where=Job.__table__.c.status == 'queued'))
+
+
+def schedule_recurring():
+    # Queues every recurring task that has no queued job, to run now; the
+    # caller commits.
+    for name in recurring:
+        enqueue(name, key=name)
+
+
+def _requeue(job):
+    if job.task in recurring:
+        enqueue(job.task, key=job.task, delay=current_app.config[recurring[job.task]])
+
+
+def _due(now, lease):
+    return or_(
+        (Job.status == 'queued') & (Job.run_at <= now),
+        # the worker holding it has presumably died
+        (Job.status == 'running') & (Job.locked_at < now - lease))
+
+
+def claim(limit=10):
+    # Marks up to limit due jobs as running and returns their ids.
+    now = datetime.utcnow()
+    lease = timedelta(seconds=current_app.config.get('JOBS_LEASE_SECONDS', 300))
+    candidates = db.session.query(Job.id, Job.status, Job.locked_at) \
+        .filter(_due(now, lease)) \
+        .order_by(Job.run_at) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    claimed = []
+    for job_id, status, locked_at in candidates:
+        # a no-op under FOR UPDATE; guards against other workers on SQLite
+        same_lease = Job.locked_at.is_(None) if locked_at is None else Job.locked_at == locked_at
+        updated = db.session.query(Job) \
+            .filter(Job.id == job_id, Job.status == status, same_lease) \
+            .update({"status": 'running', "locked_at": now,
+                     "attempts": Job.attempts + 1}, synchronize_session=False)
+        if updated:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def backoff(attempts):
+    base = current_app.config.get('JOBS_BACKOFF_SECONDS', 5)
+    ceiling = current_app.config.get('JOBS_BACKOFF_MAX_SECONDS', 3600)
+    # exponential, with jitter so failed jobs don't retry in lockstep
+    return min(base * 2 ** (attempts - 1), ceiling) * random.uniform(0.5, 1.0)
+
+
+def run(job_id):
+    job = db.session.get(Job, job_id)
+    try:
+        handler = tasks[job.task]
+        handler(**job.payload)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            current_app.logger.error('Job %d (%s) failed for good:\n%s',
+                                     job.id, job.task, job.last_error)
+            _requeue(job)
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=backoff(job.attempts))
+        job.locked_at = None
+        db.session.commit()
+        return False
+    job.status = 'done'
+    job.locked_at = None
+    job.last_error = None
+    _requeue(job)
+    db.session.commit()
+    return True
+
+
+def prune():
+    # done jobs are kept for JOBS_RETENTION_DAYS for inspection
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('JOBS_RETENTION_DAYS', 7))
+    db.session.query(Job).filter(Job.status == 'done', Job.updated_at < cutoff) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+
+def work(app, burst=False, poll_interval=None, stop=None):
+    # Runs jobs until stop is set or, with burst, until none are due.
+    poll_interval = poll_interval or app.config.get('JOBS_POLL_INTERVAL', 1.0)
+    pruned_at = 0
+    processed = 0
+    with app.app_context():
+        schedule_recurring()
+        db.session.commit()
+    while stop is None or not stop.is_set():
+        with app.app_context():
+            ids = claim(app.config.get('JOBS_BATCH_SIZE', 10))
+            for job_id in ids:
+                run(job_id)
+                processed += 1
+            if time.monotonic() - pruned_at > 60:
+                prune()
+                pruned_at = time.monotonic()
+            db.session.remove()
+        if ids:
+            continue
+        if burst:
+            break
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+    return processed
+
+
+def start_worker_threads(app):
+    stop = threading.Event()
+    for i in range(app.config.get('JOBS_WORKER_THREADS', 0)):
+        thread = threading.Thread(target=work, args=(app,), kwargs={"stop": stop},
+                                  name='fyyur-jobs-%d' % i, daemon=True)
+        thread.start()
+    return stop
+
+
+def init_jobs(app):
+    # In-process workers start with the first request, so CLI commands such as
+    # `flask db upgrade` don't run jobs.
+    started = []
+    lock = threading.Lock()
+
+    def start():
+        with lock:
+            if not started:
+                started.append(start_worker_threads(app))
+
+    if app.config.get('JOBS_WORKER_THREADS', 0):
+        app.before_request(start)
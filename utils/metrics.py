@@ -0,0 +1,285 @@
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#
+# Request threads never share a counter: each thread updates its own shard,
+# and /metrics sums the shards when it is scraped. When a thread exits its
+# shard is folded into the registry's base totals and dropped, so servers
+# that start a thread per connection don't collect shards. Under a multi-process
+# server (gunicorn) each worker also writes its totals to <pid>.json in
+# METRICS_MULTIPROC_DIR, at most every METRICS_FLUSH_INTERVAL seconds, and
+# whichever worker serves /metrics merges every file in the directory.
+# Counters and histograms of workers that have exited are kept; their gauges
+# are not.
+#----------------------------------------------------------------------------#
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from flask import Response, current_app, g, request, before_render_template, template_rendered
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'fyyur_http_requests_total':
+        ('counter', 'Requests served, by endpoint, method and status.'),
+    'fyyur_http_request_duration_seconds':
+        ('histogram', 'Request latency, by endpoint.'),
+    'fyyur_http_requests_in_flight':
+        ('gauge', 'Requests being served.'),
+    'fyyur_template_render_seconds':
+        ('histogram', 'Template render time, by template.'),
+    'fyyur_db_queries_total':
+        ('counter', 'SQL statements executed, by endpoint.'),
+    'fyyur_db_seconds':
+        ('histogram', 'Time spent in the database per request, by endpoint.'),
+    'fyyur_cache_hits_total':
+        ('counter', 'Response and fragment cache hits, by namespace.'),
+    'fyyur_cache_misses_total':
+        ('counter', 'Response and fragment cache misses, by namespace.'),
+}
+
+
+class Shard(object):
+    # Written only by the thread that owns it.
+
+    def __init__(self):
+        self.values = dict()
+        self.histograms = dict()
+
+    def add(self, name, labels, amount=1):
+        key = (name, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            # one count per bucket plus +Inf, then sum
+            histogram = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    def merge(self, other):
+        for key, value in list(other.values.items()):
+            self.values[key] = self.values.get(key, 0) + value
+        for key, histogram in list(other.histograms.items()):
+            total = self.histograms.get(key)
+            self.histograms[key] = list(histogram) if total is None else \
+                [a + b for a, b in zip(total, histogram)]
+
+
+class Registry(object):
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        # the totals of the shards of threads that have exited
+        self._base = Shard()
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._flushed_at = 0.0
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        # the shard's thread has exited, so nothing writes to it any more
+        with self._lock:
+            self._base.merge(shard)
+            self._shards.remove(shard)
+
+    def add_collector(self, collector):
+        # collector() returns [(name, labels, value)] of process-wide values
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        # This process's totals, as {"values": [...], "histograms": [...]}.
+        totals = Shard()
+        with self._lock:
+            # together, so a shard retired meanwhile is counted once
+            totals.merge(self._base)
+            shards = list(self._shards)
+        for shard in shards:
+            totals.merge(shard)
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                totals.values[(name, labels)] = value
+        return {
+            "values": [[name, list(labels), value]
+                       for (name, labels), value in totals.values.items()],
+            "histograms": [[name, list(labels), histogram]
+                           for (name, labels), histogram in totals.histograms.items()]
+        }
+
+    def flush(self, directory, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed_at < current_app.config.get('METRICS_FLUSH_INTERVAL', 1):
+            return
+        self._flushed_at = now
+        path = os.path.join(directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self, directory=None):
+        # Snapshots of every process to merge: just this one, or every
+        # worker's file when running multi-process.
+        if not directory:
+            return [(os.getpid(), self.snapshot())]
+        self.flush(directory, force=True)
+        snapshots = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshots.append((int(filename[:-5]), json.load(f)))
+            except (ValueError, OSError):
+                continue
+        return snapshots
+
+
+registry = Registry()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                          .replace('"', '\\"').replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+def render(snapshots):
+    values = dict()
+    histograms = dict()
+    for pid, snapshot in snapshots:
+        alive = pid == os.getpid() or _alive(pid)
+        for name, labels, value in snapshot["values"]:
+            if METRICS[name][0] == 'gauge' and not alive:
+                continue
+            key = (name, tuple(tuple(label) for label in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.get(key)
+            histograms[key] = histogram if total is None else \
+                [a + b for a, b in zip(total, histogram)]
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+        if kind == 'histogram':
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram[:-1]):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (
+                        name, _format_labels(labels + (('le', bound),)), cumulative))
+                lines.append('%s_sum%s %r' % (name, _format_labels(labels), histogram[-1]))
+                lines.append('%s_count%s %d' % (name, _format_labels(labels), cumulative))
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append('%s%s %r' % (name, _format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    registry.shard().add('fyyur_http_requests_in_flight', ())
+    g.metrics_started = time.perf_counter()
+
+
+def _finish_request(response):
+    # runs before utils.profiling's after_request, which pops g.sql_profile
+    shard = registry.shard()
+    endpoint = _endpoint()
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        shard.observe('fyyur_http_request_duration_seconds', (('endpoint', endpoint),),
+                      time.perf_counter() - started)
+    shard.add('fyyur_http_requests_total', (
+        ('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+    profile = g.get('sql_profile')
+    if profile is not None:
+        shard.add('fyyur_db_queries_total', (('endpoint', endpoint),), profile.count)
+        shard.observe('fyyur_db_seconds', (('endpoint', endpoint),), profile.seconds)
+    return response
+
+
+def _teardown_request(exc):
+    registry.shard().add('fyyur_http_requests_in_flight', (), -1)
+    directory = current_app.config.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        registry.flush(directory)
+
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    starts = g.get('metrics_templates')
+    if starts:
+        registry.shard().observe('fyyur_template_render_seconds',
+                                 (('template', template.name),),
+                                 time.perf_counter() - starts.pop())
+
+
+def _cache_stats():
+    from utils.cache import cache
+    from utils.fragments import fragments
+    samples = []
+    for prefix, store in (('', cache), ('fragment:', fragments)):
+        for namespace, stats in store.stats().items():
+            labels = (('namespace', prefix + namespace),)
+            samples.append(('fyyur_cache_hits_total', labels, stats["hits"]))
+            samples.append(('fyyur_cache_misses_total', labels, stats["misses"]))
+    return samples
+
+
+def metrics():
+    snapshots = registry.collect(current_app.config.get('METRICS_MULTIPROC_DIR'))
+    return Response(render(snapshots), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    # Call after init_profiling, so the DB time of each request is still on g.
+    directory = app.config.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    try:
+        before_render_template.connect(_template_started, app)
+        template_rendered.connect(_template_rendered, app)
+    except RuntimeError:
+        # older Flask without blinker installed has no signals
+        pass
+    registry.add_collector(_cache_stats)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL profiling.
+#
+# Every request counts its statements and the time spent in the database;
+# that much is cheap enough to leave on. A request slower than
+# SQL_PROFILE_SLOW_REQUEST_MS, one that repeats a statement more than
+# SQL_PROFILE_N_PLUS_ONE times (the usual sign of an N+1 loop), or one sent
+# with the SQL_PROFILE_HEADER header is logged as a single JSON line with its
+# slowest statements. The header also records bind parameters and adds the
+# totals to the response headers.
+#----------------------------------------------------------------------------#
+import heapq
+import json
+import time
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile(object):
+    def __init__(self, detailed=False, top=5):
+        self.detailed = detailed
+        self.top = top
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = dict()
+        self.slowest = []
+
+    def record(self, statement, parameters, seconds):
+        self.count += 1
+        self.seconds += seconds
+        # statements are rendered with placeholders, so the text is the shape
+        self.shapes[statement] = self.shapes.get(statement, 0) + 1
+        if len(self.slowest) < self.top or seconds > self.slowest[0][0]:
+            entry = (seconds, self.count, statement,
+                     parameters if self.detailed else None)
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heapreplace(self.slowest, entry)
+
+    def repeated(self, threshold):
+        return dict((statement, count) for statement, count in self.shapes.items()
+                    if count > threshold)
+
+    def report(self, n_plus_one):
+        slowest = []
+        for seconds, _, statement, parameters in sorted(self.slowest, reverse=True):
+            entry = {"ms": round(seconds * 1000, 3), "statement": statement}
+            if self.detailed:
+                entry["parameters"] = repr(parameters)
+            slowest.append(entry)
+        return {
+            "queries": self.count,
+            "db_ms": round(self.seconds * 1000, 3),
+            "slowest": slowest,
+            "n_plus_one": [{"statement": statement, "count": count}
+                           for statement, count in n_plus_one.items()]
+        }
+
+
+def _current_profile():
+    if has_app_context():
+        return g.get('sql_profile')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault('sql_profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    starts = conn.info.get('sql_profile_start')
+    if profile is not None and starts:
+        profile.record(statement, parameters, time.perf_counter() - starts.pop())
+
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get('sql_profile_start') if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def _start_profile():
+    config = current_app.config
+    header = config.get('SQL_PROFILE_HEADER', 'X-Profile-SQL')
+    g.sql_profile = RequestProfile(
+        detailed=request.headers.get(header, '').lower() in ('1', 'true', 'yes'),
+        top=config.get('SQL_PROFILE_TOP_STATEMENTS', 5))
+    g.sql_profile_started = time.perf_counter()
+
+
+def _finish_profile(response):
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return response
+    config = current_app.config
+    elapsed_ms = (time.perf_counter() - g.pop('sql_profile_started')) * 1000
+    n_plus_one = profile.repeated(config.get('SQL_PROFILE_N_PLUS_ONE', 5))
+    if profile.detailed:
+        response.headers['X-SQL-Queries'] = str(profile.count)
+        response.headers['X-SQL-Time-Ms'] = '%.3f' % (profile.seconds * 1000)
+    slow = elapsed_ms >= config.get('SQL_PROFILE_SLOW_REQUEST_MS', 500)
+    if slow or n_plus_one or profile.detailed:
+        line = {
+            "event": "sql_profile",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "ms": round(elapsed_ms, 3),
+            "slow": slow
+        }
+        line.update(profile.report(n_plus_one))
+        log = current_app.logger.warning if slow or n_plus_one else current_app.logger.info
+        log(json.dumps(line, default=str))
+    return response
+
+
+def init_profiling(app):
+    if not app.config.get('SQL_PROFILE_ENABLED', True):
+        return
+    # on the Engine class, so replica engines are profiled too
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
@@ -0,0 +1,29 @@
+from utils.connection import db
+
+# Postgres stores genres as a native array; SQLite (used for local runs and
+# benchmarks without a Postgres server) has no array type, so fall back to JSON.
+StringArray = db.ARRAY(db.String(120)).with_variant(db.JSON(), 'sqlite')
+
+# the genres venues and artists can list, offered by the forms and accepted by
+# the genre filters (see queries/facets.py)
+GENRES = (
+    'Alternative',
+    'Blues',
+    'Classical',
+    'Country',
+    'Electronic',
+    'Folk',
+    'Funk',
+    'Hip-Hop',
+    'Heavy Metal',
+    'Instrumental',
+    'Jazz',
+    'Musical Theatre',
+    'Pop',
+    'Punk',
+    'R&B',
+    'Reggae',
+    'Rock n Roll',
+    'Soul',
+    'Other',
+)